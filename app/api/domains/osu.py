@@ -66,7 +66,9 @@ from app.objects.player import Player
 from app.objects.score import Grade
 from app.objects.score import Score
 from app.objects.score import SubmissionStatus
+from app.repositories import first_places as first_places_repo
 from app.repositories import maps as maps_repo
+from app.repositories import player_map_plays as player_map_plays_repo
 from app.repositories import players as players_repo
 from app.repositories import scores as scores_repo
 from app.repositories import stats as stats_repo
@@ -977,6 +979,32 @@ async def osuSubmitModularSelector(
             },
         )
 
+        await player_map_plays_repo.increment(
+            score.player.id,
+            score.mode,
+            score.bmap.md5,
+        )
+
+        if score.status == SubmissionStatus.BEST:
+            # the map's cached api leaderboards are now out of date
+            await app.state.services.redis.delete(
+                f"bancho:map_scores:{score.bmap.md5}:{int(score.mode)}",
+            )
+
+        if (
+            score.status == SubmissionStatus.BEST
+            and score.rank == 1
+            and not score.player.restricted
+        ):
+            # keep the materialized #1s in sync for /get_player_scores
+            assert score.id is not None
+            await first_places_repo.upsert(
+                score.bmap.md5,
+                score.mode,
+                score.id,
+                score.player.id,
+            )
+
     if score.passed:
         replay_data = await replay_file.read()
 
@@ -15,8 +15,7 @@ from fastapi.openapi.utils import get_openapi
 from fastapi.requests import Request
 from fastapi.responses import ORJSONResponse
 from fastapi.responses import Response
-from starlette.middleware.base import RequestResponseEndpoint
-from starlette.requests import ClientDisconnect
+from starlette.middleware.cors import CORSMiddleware
 
 import app.bg_loops
 import app.settings
@@ -25,6 +24,9 @@ import app.utils
 from app.api import api_router  # type: ignore[attr-defined]
 from app.api import domains
 from app.api import middlewares
+from app.api.v1.api import APIError
+from app.api.v1.api import StatusError
+from app.api.v1.api import status_response
 from app.logging import Ansi
 from app.logging import log
 from app.objects import collections
@@ -79,36 +81,35 @@ def init_exception_handlers(asgi_app: BanchoAPI) -> None:
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
         )
 
+    @asgi_app.exception_handler(APIError)
+    async def handle_api_error(request: Request, exc: APIError) -> Response:
+        """Render errors raised by the v1 dependencies like the handlers' own."""
+        return ORJSONResponse(
+            content={"success": False, "response": {"message": exc.message}},
+            status_code=exc.status_code,
+        )
+
+    @asgi_app.exception_handler(StatusError)
+    async def handle_status_error(request: Request, exc: StatusError) -> Response:
+        """Render errors raised by the v1 dependencies like the handlers' own."""
+        return status_response(exc.content, exc.status_code)
+
 
 def init_middlewares(asgi_app: BanchoAPI) -> None:
     """Initialize our app's middleware stack."""
     asgi_app.add_middleware(middlewares.MetricsMiddleware)
     asgi_app.add_middleware(middlewares.RateLimitMiddleware)
-
-    @asgi_app.middleware("http")
-    async def http_middleware(
-        request: Request,
-        call_next: RequestResponseEndpoint,
-    ) -> Response:
-        # if an osu! client is waiting on leaderboard data
-        # and switches to another leaderboard, it will cancel
-        # the previous request midway, resulting in a large
-        # error in the console. this is to catch that :)
-
-        try:
-            return await call_next(request)
-        except ClientDisconnect:
-            # client disconnected from the server
-            # while we were reading the body.
-            return Response("Client is stupppod")
-        except RuntimeError as exc:
-            if exc.args[0] == "No response returned.":
-                # client disconnected from the server
-                # while we were sending the response.
-                return Response("Client is stupppod")
-
-            # unrelated issue, raise normally
-            raise exc
+    asgi_app.add_middleware(middlewares.ClientDisconnectMiddleware)
+
+    # added last so it's outermost, answering
+    # preflight requests before anything else runs
+    asgi_app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+        allow_headers=["*"],
+    )
 
 
 def init_events(asgi_app: BanchoAPI) -> None:
@@ -1,89 +1,420 @@
 from __future__ import annotations
 
+import asyncio
+import functools
+import os
+import sys
 import time
-import app.state
-
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.middleware.base import RequestResponseEndpoint
-from starlette.requests import Request
-from starlette.responses import Response
+from collections.abc import Callable
+from collections.abc import Iterable
 
-from collections import defaultdict
+from starlette.requests import ClientDisconnect
+from starlette.types import ASGIApp
+from starlette.types import Message
+from starlette.types import Receive
+from starlette.types import Scope
+from starlette.types import Send
 
+import app.settings
+import app.state
+from app._typing import IPAddress
 from app.logging import Ansi
-from app.logging import log
+from app.logging import get_timestamp
+from app.logging import get_timezone
 from app.logging import magnitude_fmt_time
-from app.logging import printc
 
 
-class MetricsMiddleware(BaseHTTPMiddleware):
-    async def dispatch(
-        self,
-        request: Request,
-        call_next: RequestResponseEndpoint,
-    ) -> Response:
+IPResolverFunc = Callable[[Iterable[tuple[bytes, bytes]]], IPAddress]
+
+
+def get_client_ip(scope: Scope, resolve_ip: IPResolverFunc) -> IPAddress:
+    """Resolve the client's ip address, at most once per request."""
+    state = scope.setdefault("state", {})
+
+    ip: IPAddress | None = state.get("client_ip")
+    if ip is None:
+        ip = resolve_ip(scope["headers"])
+        state["client_ip"] = ip
+
+    return ip
+
+
+def get_host(scope: Scope) -> bytes:
+    """Find the host header in an asgi scope's raw headers."""
+    raw_headers: list[tuple[bytes, bytes]] = scope["headers"]
+    for key, value in raw_headers:
+        if key == b"host":
+            return value
+
+    return b""
+
+
+def _encode_colour(col: Ansi) -> bytes:
+    return repr(col).encode()
+
+
+# log colour for each class of status code (1xx, 2xx, ...)
+STATUS_CODE_COLOURS = tuple(
+    _encode_colour(col)
+    for col in (
+        Ansi.LRED,
+        Ansi.LRED,
+        Ansi.LGREEN,
+        Ansi.LYELLOW,
+        Ansi.LRED,
+        Ansi.LRED,
+        Ansi.LRED,
+        Ansi.LRED,
+        Ansi.LRED,
+        Ansi.LRED,
+    )
+)
+
+GRAY = _encode_colour(Ansi.GRAY)
+LBLUE = _encode_colour(Ansi.LBLUE)
+RESET = _encode_colour(Ansi.RESET)
+
+REQUEST_LOG_FORMAT = b"%s[%s] %s[%s] %d %s%s%s | %sRequest took: %s%s%s (%s)%s\n"
+
+# request logs are buffered & written out in bulk, rather
+# than paying for a few writes to stdout on every request.
+REQUEST_LOG_FLUSH_INTERVAL = 0.05  # seconds
+
+request_log_buffer: list[bytes] = []
+request_log_flush_task: asyncio.Task[None] | None = None
+
+
+def flush_request_log_buffer() -> None:
+    if request_log_buffer:
+        # anything already printed must come out first
+        sys.stdout.flush()
+        os.write(sys.stdout.fileno(), b"".join(request_log_buffer))
+        request_log_buffer.clear()
+
+
+async def _flush_request_logs(interval: float) -> None:
+    """Write out any buffered request logs, every `interval`."""
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            flush_request_log_buffer()
+    finally:
+        # don't drop any lines buffered before shutdown
+        flush_request_log_buffer()
+
+
+def buffer_request_log(line: bytes) -> None:
+    """Queue a log line to be written out with the next flush."""
+    global request_log_flush_task
+
+    if request_log_flush_task is None or request_log_flush_task.done():
+        request_log_flush_task = asyncio.create_task(
+            _flush_request_logs(interval=REQUEST_LOG_FLUSH_INTERVAL),
+        )
+        app.state.sessions.housekeeping_tasks.add(request_log_flush_task)
+
+    request_log_buffer.append(line)
+
+
+# request metrics are aggregated in memory & handed to datadog
+# once per interval, rather than once per request.
+REQUEST_METRICS_FLUSH_INTERVAL = 1  # seconds
+
+# {(route path, status code): [count, total time (ns), max time (ns)]}
+request_metrics: dict[tuple[str, int], list[int]] = {}
+
+
+def flush_request_metrics() -> None:
+    datadog = app.state.services.datadog
+    if datadog is None or not request_metrics:
+        return
+
+    for (path, status_code), (count, total_time, max_time) in request_metrics.items():
+        tags = [f"path:{path}", f"status_code:{status_code}"]
+        datadog.increment("bancho.http.requests", value=count, tags=tags)
+        datadog.gauge(
+            "bancho.http.request_time.avg",
+            total_time / count / 1_000_000,
+            tags=tags,
+        )
+        datadog.gauge(
+            "bancho.http.request_time.max",
+            max_time / 1_000_000,
+            tags=tags,
+        )
+
+    request_metrics.clear()
+
+
+async def _flush_request_metrics(interval: float) -> None:
+    """Hand aggregated request metrics to datadog, every `interval`."""
+    while True:
+        await asyncio.sleep(interval)
+        flush_request_metrics()
+
+
+PROCESS_TIME_HEADER = b"process-time"
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.metrics_flush_task: asyncio.Task[None] | None = None
+
+    @functools.cached_property
+    def resolve_ip(self) -> IPResolverFunc:
+        # the ip resolver is only created on startup
+        return app.state.services.ip_resolver.get_ip_from_scope
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         start_time = time.perf_counter_ns()
-        response = await call_next(request)
-        end_time = time.perf_counter_ns()
+        status_code = 0
+        time_elapsed = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, time_elapsed
+
+            if message["type"] == "http.response.start":
+                time_elapsed = time.perf_counter_ns() - start_time
+                status_code = message["status"]
 
-        time_elapsed = end_time - start_time
+                message["headers"] = [
+                    *message.get("headers", ()),
+                    (PROCESS_TIME_HEADER, b"%.3f" % (time_elapsed / 1_000_000)),
+                ]
 
-        # TODO: add metric to datadog
+            await send(message)
 
-        col = (
-            Ansi.LGREEN
-            if 200 <= response.status_code < 300
-            else Ansi.LYELLOW
-            if 300 <= response.status_code < 400
-            else Ansi.LRED
+        await self.app(scope, receive, send_wrapper)
+
+        if app.state.services.datadog is not None:
+            if self.metrics_flush_task is None:
+                self.metrics_flush_task = asyncio.create_task(
+                    _flush_request_metrics(interval=REQUEST_METRICS_FLUSH_INTERVAL),
+                )
+                app.state.sessions.housekeeping_tasks.add(self.metrics_flush_task)
+
+            # key on the route's template (e.g. /v1/get_player_info)
+            # rather than the raw path, to keep the table's size bounded.
+            route = scope.get("route")
+            route_path = route.path if route is not None else "unknown"
+
+            metrics_key = (route_path, status_code)
+            metrics = request_metrics.get(metrics_key)
+            if metrics is None:
+                request_metrics[metrics_key] = [1, time_elapsed, time_elapsed]
+            else:
+                metrics[0] += 1
+                metrics[1] += time_elapsed
+                if time_elapsed > metrics[2]:
+                    metrics[2] = time_elapsed
+
+        if not app.settings.LOG_HTTP_REQUESTS:
+            return
+
+        col = STATUS_CODE_COLOURS[status_code // 100]
+        ip = get_client_ip(scope, self.resolve_ip)
+
+        buffer_request_log(
+            REQUEST_LOG_FORMAT
+            % (
+                GRAY,
+                get_timestamp(full=False, tz=get_timezone()).encode(),
+                col,
+                scope["method"].encode(),
+                status_code,
+                get_host(scope),
+                scope["path"].encode(),
+                RESET,
+                LBLUE,
+                magnitude_fmt_time(time_elapsed).encode(),
+                RESET,
+                GRAY,
+                str(ip).encode(),
+                RESET,
+            ),
         )
 
-        url = f"{request.headers['host']}{request['path']}"
-        ip = app.state.services.ip_resolver.get_ip(request.headers)
 
-        log(f"[{request.method}] {response.status_code} {url}", col, end=" | ")
-        printc(f"Request took: {magnitude_fmt_time(time_elapsed)}", end="", col=Ansi.LBLUE)
-        printc(f" ({ip})", Ansi.GRAY)
+# the per-ip buckets are split across a fixed number of
+# independent maps, so no single table grows with every client.
+# NOTE: this state lives in the worker process; each worker
+# enforces its limits independently of any others.
+RATE_LIMIT_SHARDS = 16  # must be a power of 2
+
+# buckets untouched for this long are full again, and can be dropped.
+RATE_LIMIT_SWEEP_INTERVAL = 60  # seconds
+RATE_LIMIT_BUCKET_MAX_IDLE_NS = 15 * 60 * 1_000_000_000
+
+# tokens are tracked in billionths, so refilling by elapsed
+# nanoseconds * rate stays in exact integer arithmetic.
+TOKEN = 1_000_000_000
+
+API_HOST_PREFIX = b"api."
 
-        response.headers["process-time"] = str(round(time_elapsed) / 1e6)
-        return response
+# token refills don't need fine-grained timing (at 30 req/s, a token
+# takes ~33ms), so use the cheaper coarse clock where one is available.
+rate_limit_clock_ns: Callable[[], int]
+if hasattr(time, "CLOCK_MONOTONIC_COARSE"):
+    rate_limit_clock_ns = functools.partial(
+        time.clock_gettime_ns,
+        time.CLOCK_MONOTONIC_COARSE,
+    )
+else:
+    rate_limit_clock_ns = time.monotonic_ns
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, *args, max_requests_per_second: int = 30, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.max_requests_per_second = max_requests_per_second
-        self.last_access_time = 0
-        self.tokens = 0
+# only every nth rejection per client is logged, so that
+# a flood can't make us do much work for each request.
+RATE_LIMIT_LOG_SAMPLE_MASK = 64 - 1
 
-    async def dispatch(
+RATE_LIMITED_LOG_FORMAT = (
+    b"%s[%s] %sRate Limit Exceeded - Attacker IP: %s, URL: %s (%d rejected)%s\n"
+)
+LRED = _encode_colour(Ansi.LRED)
+
+# the 429 response is prebuilt, to keep the cost of rejecting a request
+# minimal. outer middleware may modify the messages we send, so each
+# rejection sends its own copies of them.
+RATE_LIMITED_RESPONSE_HEADERS = (
+    (b"content-length", b"17"),
+    (b"content-type", b"text/plain; charset=utf-8"),
+)
+RATE_LIMITED_RESPONSE_BODY = b"Too Many Requests"
+
+
+class RateLimitMiddleware:
+    def __init__(
         self,
-        request: Request,
-        call_next: RequestResponseEndpoint,
-    ) -> Response:
-        host = request.headers.get("host", "")
-        if not host.startswith("api."):
+        app: ASGIApp,
+        max_requests_per_second: int = 30,
+        shards: int = RATE_LIMIT_SHARDS,
+    ) -> None:
+        if shards < 1 or shards & (shards - 1):
+            raise ValueError("The number of shards must be a power of 2.")
+
+        self.app = app
+        self.max_requests_per_second: int = max_requests_per_second
+        self.max_tokens: int = max_requests_per_second * TOKEN
+
+        # {packed ip: [tokens, last_refill_ns, rejections]}; the value is
+        # a list so it can be updated in place rather than re-inserted.
+        self.buckets: list[dict[bytes, list[int]]] = [{} for _ in range(shards)]
+        self.shard_mask: int = shards - 1
+        self.sweeper_task: asyncio.Task[None] | None = None
+
+    @functools.cached_property
+    def resolve_ip(self) -> IPResolverFunc:
+        # the ip resolver is only created on startup
+        return app.state.services.ip_resolver.get_ip_from_scope
+
+    async def _sweep_idle_buckets(self) -> None:
+        """Periodically evict buckets which have been idle for a while."""
+        while True:
+            await asyncio.sleep(RATE_LIMIT_SWEEP_INTERVAL)
+            current_time = rate_limit_clock_ns()
+
+            for shard in self.buckets:
+                stale_ips = [
+                    ip
+                    for ip, (_, last_refill, _) in shard.items()
+                    if current_time - last_refill > RATE_LIMIT_BUCKET_MAX_IDLE_NS
+                ]
+                for ip in stale_ips:
+                    del shard[ip]
+
+                # let requests through between shards
+                await asyncio.sleep(0)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if not get_host(scope).startswith(API_HOST_PREFIX):
             # Skip rate limiting for non-"api" subdomain requests
-            return await call_next(request)
+            await self.app(scope, receive, send)
+            return
+
+        if self.sweeper_task is None:
+            self.sweeper_task = asyncio.create_task(self._sweep_idle_buckets())
+            app.state.sessions.housekeeping_tasks.add(self.sweeper_task)
+
+        ip = get_client_ip(scope, self.resolve_ip)
+        ip_key = ip.packed
+        current_time = rate_limit_clock_ns()
 
-        current_time = time.time()
+        # NOTE: there are no awaits between the lookup & the token
+        # being consumed, so this is atomic on the event loop.
+        shard = self.buckets[hash(ip_key) & self.shard_mask]
+        bucket = shard.get(ip_key)
+        if bucket is None:
+            bucket = [self.max_tokens, current_time, 0]
+            shard[ip_key] = bucket
 
         # Refill tokens
-        elapsed_time = current_time - self.last_access_time
-        tokens_to_add = int(elapsed_time * self.max_requests_per_second)
-        self.tokens = min(self.tokens + tokens_to_add, self.max_requests_per_second)
-        self.last_access_time = current_time
+        elapsed_time = current_time - bucket[1]
+        tokens = bucket[0] + elapsed_time * self.max_requests_per_second
+        bucket[0] = tokens if tokens < self.max_tokens else self.max_tokens
+        bucket[1] = current_time
 
         # Check if enough tokens are available
-        if self.tokens < 1:
-            ip = app.state.services.ip_resolver.get_ip(request.headers)
-            url = request.url.path
-            print(f"Rate Limit Exceeded - Attacker IP: {ip}, URL: {url}")
-            return Response("Too Many Requests", status_code=429)
+        if bucket[0] < TOKEN:
+            if not bucket[2] & RATE_LIMIT_LOG_SAMPLE_MASK:
+                buffer_request_log(
+                    RATE_LIMITED_LOG_FORMAT
+                    % (
+                        GRAY,
+                        get_timestamp(full=False, tz=get_timezone()).encode(),
+                        LRED,
+                        str(ip).encode(),
+                        scope["path"].encode(),
+                        bucket[2] + 1,
+                        RESET,
+                    ),
+                )
+
+            bucket[2] += 1
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 429,
+                    "headers": list(RATE_LIMITED_RESPONSE_HEADERS),
+                },
+            )
+            await send(
+                {"type": "http.response.body", "body": RATE_LIMITED_RESPONSE_BODY},
+            )
+            return
 
         # Consume a token
-        self.tokens -= 1
+        bucket[0] -= TOKEN
 
         # Call the next middleware
-        response = await call_next(request)
+        await self.app(scope, receive, send)
+
+
+class ClientDisconnectMiddleware:
+    """Quietly drop requests whose client disconnected midway through.
+
+    e.g. if an osu! client is waiting on leaderboard data and switches to
+    another leaderboard, it will cancel the previous request midway, which
+    would otherwise result in a large error in the console."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        return response
+        try:
+            await self.app(scope, receive, send)
+        except ClientDisconnect:
+            # the client disconnected while we were reading the
+            # body; there's nobody left to send a response to.
+            pass
@@ -1,21 +1,36 @@
 """ api: bancho.py's developer api for interacting with server state """
 from __future__ import annotations
 
+import asyncio
 import datetime
 import hashlib
+import hmac
 import struct
+import time
+import weakref
+from collections.abc import AsyncIterator
+from collections.abc import Awaitable
+from collections.abc import Callable
+from functools import lru_cache
 from pathlib import Path as SystemPath
+from typing import cast
 from typing import Literal
 
+import anyio
+import orjson
+from databases.interfaces import Record
 from fastapi import APIRouter
 from fastapi import Depends
 from fastapi import status
 from fastapi.param_functions import Query
+from fastapi.responses import FileResponse
 from fastapi.responses import ORJSONResponse
 from fastapi.responses import Response
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPAuthorizationCredentials as HTTPCredentials
 from fastapi.security import HTTPBearer
 
+import app.bg_loops
 import app.packets
 import app.settings
 import app.state
@@ -23,18 +38,27 @@ import app.usecases.performance
 from app.constants import regexes
 from app.constants.gamemodes import GameMode
 from app.constants.mods import Mods
+from app.constants.privileges import Privileges
+from app.discord import Embed
+from app.discord import Webhook
+from app.logging import Ansi
+from app.logging import log
 from app.objects.beatmap import Beatmap
-from app.objects.beatmap import ensure_local_osu_file
+from app.objects.beatmap import fetch_local_osu_file
+from app.objects.beatmap import RankedStatus
 from app.objects.clan import Clan
 from app.objects.player import Player
 from app.repositories import players as players_repo
 from app.repositories import scores as scores_repo
 from app.repositories import stats as stats_repo
+from app.usecases.beatmap_status import BEATMAPSET_COVER_URL
+from app.usecases.beatmap_status import BEATMAPSET_URL
+from app.usecases.beatmap_status import make_status_embed
+from app.usecases.beatmap_status import STATUS_CHANGE_COLOURS
+from app.usecases.beatmap_status import STATUS_CHANGE_DESCRIPTION
 from app.usecases.performance import ScoreParams
-from app.constants.privileges import Privileges
-# Import discord webhook
-from app.discord import Webhook, Embed
-from app.repositories import maps as maps_repo
+from app.utils import make_safe_name
+
 AVATARS_PATH = SystemPath.cwd() / ".data/avatars"
 BEATMAPS_PATH = SystemPath.cwd() / ".data/osu"
 REPLAYS_PATH = SystemPath.cwd() / ".data/osr"
@@ -44,12 +68,81 @@ SCREENSHOTS_PATH = SystemPath.cwd() / ".data/ss"
 router = APIRouter()
 oauth2_scheme = HTTPBearer(auto_error=False)
 
+
+def require_api_key(token: HTTPCredentials | None = Depends(oauth2_scheme)) -> int:
+    """Resolve the id of the player owning the request's api key."""
+    if token is not None:
+        player_id = app.state.sessions.api_keys.get(token.credentials)
+        if player_id is not None:
+            return player_id
+
+    raise StatusError(status.HTTP_401_UNAUTHORIZED, INVALID_API_KEY)
+
+
+class APIError(Exception):
+    """An error response in the nomination & moderation handlers' format."""
+
+    def __init__(self, status_code: int, message: str) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+class StatusError(Exception):
+    """An error response in the read-only handlers' {"status": ...} format."""
+
+    def __init__(self, status_code: int, content: bytes) -> None:
+        super().__init__(content)
+        self.status_code = status_code
+        self.content = content
+
+
+def require_discord_user(
+    priv: Privileges,
+    denied_message: str,
+) -> Callable[..., Awaitable[players_repo.Player]]:
+    """Create a dependency resolving the discord user behind a request.
+
+    The osu!api key is checked before anything is looked up, so
+    requests with a bad key never reach redis or the database."""
+
+    async def dependency(
+        discord_id: int
+        | None = Query(
+            None,
+            alias="discord_id",
+            ge=100000000000000000,
+            le=999999999999999999,
+        ),
+        key: str | None = Query(None, alias="key", min_length=1, max_length=64),
+    ) -> players_repo.Player:
+        if not discord_id or not key:
+            raise APIError(status.HTTP_400_BAD_REQUEST, "Missing required parameters!")
+
+        if not is_valid_osu_api_key(key):
+            raise APIError(status.HTTP_403_FORBIDDEN, "Invalid osu!api key!")
+
+        user_info = await fetch_player_by_discord_id(discord_id)
+        if user_info is None:
+            raise APIError(status.HTTP_404_NOT_FOUND, "User not found!")
+
+        if not user_info["priv"] & priv:
+            raise APIError(status.HTTP_403_FORBIDDEN, denied_message)
+
+        return user_info
+
+    return dependency
+
+
+require_nat = require_discord_user(Privileges.NAT, "You are not a NAT!")
+require_staff = require_discord_user(Privileges.STAFF, "You are not a Staff!")
+
 # NOTE: the api is still under design and is subject to change.
 # to keep up with breaking changes, please either join our discord,
 # or keep up with changes to https://github.com/JKBGL/gulag-api-docs.
 
 # Unauthorized (no api key required)
-# GET /search_players: returns a list of matching users, based on a passed string, sorted by ascending ID.
+# GET /search_players: returns a list of users whose names start with a passed string, sorted by ascending ID.
 # GET /get_player_count: return total registered & online player counts.
 # GET /get_player_info: return info or stats for a given player.
 # GET /get_player_status: return a player's current status, if online.
@@ -75,6 +168,359 @@ oauth2_scheme = HTTPBearer(auto_error=False)
 
 DATETIME_OFFSET = 0x89F7FF5F7B58000
 
+REPLAY_CHUNK_SIZE = 64 * 1024  # bytes
+
+# query parameter patterns; pydantic compiles these once per route
+USERNAME_PATTERN = regexes.USERNAME.pattern
+
+# how long /get_player_count may serve a stale registered player count
+TOTAL_PLAYER_COUNT_TTL = 30  # seconds
+
+total_player_count = 0
+total_player_count_expires_at = 0.0
+
+# how long /get_player_status caches offline players' last seen time,
+# and how long it remembers that a player doesn't exist at all
+PLAYER_STATUS_CACHE_TTL = 3  # seconds
+PLAYER_NOT_FOUND_CACHE_TTL = 60  # seconds
+
+# online players' last /get_player_status response, the status it was built
+# from, and when it expires; it's rebuilt early if their status changes.
+# entries are dropped along with the player object once they log out.
+ONLINE_PLAYER_STATUS_CACHE_TTL = 5  # seconds
+
+online_player_status_responses: weakref.WeakKeyDictionary[
+    Player,
+    tuple[tuple[object, ...], float, bytes],
+] = weakref.WeakKeyDictionary()
+
+# how long /get_map_scores leaderboards are cached for; they're
+# also dropped whenever a new best score is set on the map & mode
+MAP_SCORES_CACHE_TTL = 30  # seconds
+
+# how long /get_leaderboard pages are cached for
+LEADERBOARD_CACHE_TTL = 30  # seconds
+
+# pp leaderboard pages past this offset are found via the redis rank
+# sorted sets, rather than having mysql walk through every prior row
+LEADERBOARD_MAX_SQL_OFFSET = 1000
+
+# how long /get_clan responses are cached for; they're
+# also dropped whenever a member joins or leaves the clan
+CLAN_CACHE_TTL = 60  # seconds
+
+# the key the nomination & moderation endpoints are gated behind
+OSU_API_KEY_BYTES = app.settings.OSU_API_KEY.encode()
+
+# how long discord-linked player lookups are cached in redis;
+# the player entry is also dropped whenever their privileges change
+DISCORD_PLAYER_CACHE_TTL = 300  # seconds
+
+# the /get_player_info scopes which include each section
+PLAYER_INFO_SCOPES = frozenset(("info", "all"))
+PLAYER_STATS_SCOPES = frozenset(("stats", "all"))
+
+# the stats columns exposed by /get_player_info, in response order
+PLAYER_STATS_FIELDS = (
+    "id",
+    "mode",
+    "tscore",
+    "rscore",
+    "pp",
+    "plays",
+    "playtime",
+    "acc",
+    "max_combo",
+    "total_hits",
+    "replay_views",
+    "xh_count",
+    "x_count",
+    "sh_count",
+    "s_count",
+    "a_count",
+)
+
+# sql for the hot handlers, built once at import time
+LIST_PLAYERS_QUERY = (
+    "SELECT id, name "
+    "FROM users "
+    "WHERE priv & 3 = 3 "
+    "ORDER BY id ASC "
+    "LIMIT :limit"
+)
+SEARCH_PLAYERS_QUERY = (
+    "SELECT id, name "
+    "FROM users "
+    "WHERE name LIKE :name "
+    "AND priv & 3 = 3 "
+    "ORDER BY id ASC "
+    "LIMIT :limit"
+)
+PLAYER_ID_BY_DISCORD_ID_QUERY = "SELECT id FROM users WHERE discord_id = :discord_id"
+VOTER_AND_MAPSET_QUERY = (
+    "SELECT u.id, u.priv, u.name, m.status, m.artist, m.title, m.creator "
+    "FROM users u "
+    "LEFT JOIN maps m ON m.set_id = :set_id "
+    "WHERE u.discord_id = :discord_id "
+    "LIMIT 1"
+)
+MAPSET_QUERY = (
+    "SELECT set_id, status, artist, title, creator "
+    "FROM maps "
+    "WHERE set_id = :set_id "
+    "LIMIT 1"
+)
+# the score queries below have their mods, status
+# & ordering conditions appended by their handlers
+PLAYER_SCORES_QUERY = (
+    "SELECT t.id, t.map_md5, t.score, t.pp, t.acc, t.max_combo, "
+    "t.mods, t.n300, t.n100, t.n50, t.nmiss, t.ngeki, t.nkatu, t.grade, "
+    "t.status, t.mode, t.play_time, t.time_elapsed, t.perfect "
+    "FROM scores t "
+    "INNER JOIN maps b ON t.map_md5 = b.md5 "
+    "WHERE t.userid = :user_id AND t.mode = :mode"
+)
+PLAYER_FIRST_PLACES_QUERY = (
+    "SELECT t.id, t.map_md5, t.score, t.pp, t.acc, t.max_combo, "
+    "t.mods, t.n300, t.n100, t.n50, t.nmiss, t.ngeki, t.nkatu, t.grade, "
+    "t.status, t.mode, t.time_elapsed, t.play_time, t.perfect "
+    "FROM first_places fp "
+    "INNER JOIN scores t ON t.id = fp.score_id "
+    "INNER JOIN maps b ON fp.map_md5 = b.md5 "
+    "WHERE fp.userid = :user_id AND fp.mode = :mode "
+    "AND t.status = 2 AND b.status IN (2, 3, 5)"
+)
+MAP_SCORES_QUERY = (
+    "SELECT s.map_md5, s.id, s.score, s.pp, s.acc, s.max_combo, s.mods, "
+    "s.n300, s.n100, s.n50, s.nmiss, s.ngeki, s.nkatu, s.grade, s.status, "
+    "s.mode, s.play_time, s.time_elapsed, s.userid, s.perfect, "
+    "u.name player_name, u.country, "
+    "c.id clan_id, c.name clan_name, c.tag clan_tag "
+    "FROM scores s "
+    "INNER JOIN users u ON u.id = s.userid "
+    "LEFT JOIN clans c ON c.id = u.clan_id "
+    "WHERE s.map_md5 = :map_md5 "
+    "AND s.mode = :mode "
+    "AND s.status = 2 "
+    "AND u.priv & 1"
+)
+
+LEADERBOARD_QUERY = (
+    "SELECT u.id as player_id, u.name, u.country, s.tscore, s.rscore, "
+    "s.pp, s.plays, s.playtime, s.acc, s.max_combo, "
+    "s.xh_count, s.x_count, s.sh_count, s.s_count, s.a_count, "
+    "u.clan_id "
+    "FROM stats s "
+    "LEFT JOIN users u USING (id)"
+)
+
+# static error responses, serialized once at import time
+INVALID_API_KEY = orjson.dumps({"status": "Invalid API key."})
+ID_OR_NAME_REQUIRED = orjson.dumps({"status": "Must provide either id OR name!"})
+PLAYER_NOT_FOUND = orjson.dumps({"status": "Player not found."})
+INVALID_GAMEMODE = orjson.dumps({"status": "Invalid gamemode."})
+SCORE_NOT_FOUND = orjson.dumps({"status": "Score not found."})
+ID_OR_MD5_REQUIRED = orjson.dumps({"status": "Must provide either id or md5!"})
+MAP_NOT_FOUND = orjson.dumps({"status": "Map not found."})
+REPLAY_NOT_FOUND = orjson.dumps({"status": "Replay not found."})
+POOL_NOT_FOUND = orjson.dumps({"status": "Pool not found."})
+POOL_ID_OR_NAME_REQUIRED = orjson.dumps(
+    {"status": "Must provide either id or name."},
+)
+MATCH_NOT_FOUND = orjson.dumps({"status": "Match not found."})
+CLAN_NOT_FOUND = orjson.dumps({"status": "Clan not found."})
+BEATMAP_NOT_FOUND = orjson.dumps({"status": "Beatmap not found."})
+BEATMAP_FILE_UNAVAILABLE = orjson.dumps(
+    {"status": "Beatmap file could not be fetched."},
+)
+
+# descriptions for the vote api's announcements
+NOMINATED_DESCRIPTION = (
+    "[{artist} - {title} by {creator}](" + BEATMAPSET_URL + ") "
+    "has 1/2 votes for qualification. (Vote by {username}) "
+    "One more vote is needed!"
+)
+QUALIFIED_DESCRIPTION = (
+    "[{artist} - {title} ({creator})](" + BEATMAPSET_URL + ") is now qualified!"
+)
+
+
+def serialize_record(obj: object) -> dict[str, object]:
+    """Serialize database rows for orjson, which can't handle them natively.
+
+    This lets handlers pass rows they don't modify straight into a
+    response, rather than first copying each one into a new dict."""
+    # the backends' rows aren't Record subclasses,
+    # but they all expose their columns as a mapping
+    mapping = getattr(obj, "_mapping", None)
+    if mapping is None:
+        raise TypeError
+    return dict(mapping)
+
+
+def json_response(content: object, status_code: int = status.HTTP_200_OK) -> Response:
+    """Serialize a json response with orjson's default options.
+
+    ORJSONResponse also converts non-str dict keys, which costs
+    a little extra on large payloads; use this where keys are all str."""
+    return Response(
+        content=orjson.dumps(content, default=serialize_record),
+        status_code=status_code,
+        media_type="application/json",
+    )
+
+
+def status_response(content: bytes, status_code: int) -> Response:
+    """Return a pre-serialized json response."""
+    return Response(
+        content=content,
+        status_code=status_code,
+        media_type="application/json",
+    )
+
+
+def is_valid_osu_api_key(key: str) -> bool:
+    """Check `key` against our osu!api key in constant time."""
+    # compare bytes; compare_digest rejects non-ascii strs
+    return hmac.compare_digest(key.encode(), OSU_API_KEY_BYTES)
+
+
+async def post_webhooks(*webhooks: Webhook) -> None:
+    """Post a number of discord webhooks concurrently."""
+    await asyncio.gather(*(webhook.post() for webhook in webhooks))
+
+
+# status change embeds are held briefly & posted together per
+# webhook url; discord accepts up to 10 embeds in one message.
+WEBHOOK_BATCH_DELAY = 0.2  # seconds
+WEBHOOK_MAX_EMBEDS = 10
+
+queued_embeds: dict[str, list[Embed]] = {}
+webhook_batch_task: asyncio.Task[None] | None = None
+
+
+async def _post_queued_embeds(delay: float) -> None:
+    """Post the embeds queued over the next `delay` seconds."""
+    try:
+        await asyncio.sleep(delay)
+    finally:
+        # don't drop any embeds queued before shutdown
+        webhooks = [
+            Webhook(url, embeds=embeds[i : i + WEBHOOK_MAX_EMBEDS])
+            for url, embeds in queued_embeds.items()
+            for i in range(0, len(embeds), WEBHOOK_MAX_EMBEDS)
+        ]
+        queued_embeds.clear()
+
+        await post_webhooks(*webhooks)
+
+
+def queue_webhook_embed(url: str, embed: Embed) -> None:
+    """Queue an embed to be posted to `url` with the next batch."""
+    global webhook_batch_task
+
+    queued_embeds.setdefault(url, []).append(embed)
+
+    if webhook_batch_task is None or webhook_batch_task.done():
+        webhook_batch_task = asyncio.create_task(
+            _post_queued_embeds(delay=WEBHOOK_BATCH_DELAY),
+        )
+        app.state.sessions.housekeeping_tasks.add(webhook_batch_task)
+        webhook_batch_task.add_done_callback(
+            app.state.sessions.housekeeping_tasks.discard,
+        )
+
+
+async def fetch_ranked_leaderboard_page(
+    mode: GameMode,
+    country: str | None,
+    offset: int,
+    limit: int,
+) -> list[Record]:
+    """Fetch a page of the pp leaderboard, ordered by the redis rank sorted sets."""
+    if country is not None:
+        leaderboard_key = f"bancho:leaderboard:{mode.value}:{country.lower()}"
+    else:
+        leaderboard_key = f"bancho:leaderboard:{mode.value}"
+
+    player_ids = [
+        int(player_id)
+        for player_id in await app.state.services.redis.zrevrangebyscore(
+            leaderboard_key,
+            "+inf",
+            "(0",
+            start=offset,
+            num=limit,
+        )
+    ]
+    if not player_ids:
+        return []
+
+    rows = await app.state.services.database.fetch_all(
+        f"{LEADERBOARD_QUERY} "
+        "WHERE s.id IN :player_ids AND s.mode = :mode AND u.priv & 1",
+        {"player_ids": player_ids, "mode": mode},
+    )
+
+    placements = {player_id: idx for idx, player_id in enumerate(player_ids)}
+    return sorted(rows, key=lambda row: placements[row["player_id"]])
+
+
+async def fetch_player_by_discord_id(discord_id: int) -> players_repo.Player | None:
+    """Fetch the player linked to a discord account, cached in redis."""
+    discord_key = f"bancho:discord_ids:{discord_id}"
+    player_id = await app.state.services.redis.get(discord_key)
+
+    if player_id is None:
+        player_id = await app.state.services.database.fetch_val(
+            PLAYER_ID_BY_DISCORD_ID_QUERY,
+            {"discord_id": discord_id},
+        )
+        if player_id is None:
+            return None
+
+        await app.state.services.redis.set(
+            discord_key,
+            player_id,
+            ex=DISCORD_PLAYER_CACHE_TTL,
+        )
+
+    player_key = f"bancho:players:{int(player_id)}"
+    cached_player = await app.state.services.redis.get(player_key)
+    if cached_player is not None:
+        return cast(players_repo.Player, orjson.loads(cached_player))
+
+    player = await players_repo.fetch_one(id=int(player_id))
+    if player is None:
+        return None
+
+    await app.state.services.redis.set(
+        player_key,
+        orjson.dumps(player),
+        ex=DISCORD_PLAYER_CACHE_TTL,
+    )
+    return player
+
+
+async def update_cached_set_status(
+    set_id: int,
+    status: RankedStatus,
+    frozen: bool,
+) -> None:
+    """Update the cached copies of a set's difficulties to a new status."""
+    # maps are only ever cached along with their set,
+    # so an uncached set has no cached difficulties
+    if (bmap_set := app.state.cache.beatmapset.get(set_id)) is not None:
+        for bmap in bmap_set.maps:
+            bmap.status = status
+            bmap.frozen = frozen
+
+
+@lru_cache(maxsize=256)
+def format_mods(mods: int) -> str:
+    # a handful of mod combinations make up nearly all scores
+    return repr(Mods(mods))
+
 
 def format_clan_basic(clan: Clan) -> dict[str, object]:
     return {
@@ -122,7 +568,7 @@ def format_map_basic(m: Beatmap) -> dict[str, object]:
 
 @router.get("/calculate_pp")
 async def api_calculate_pp(
-    token: HTTPCredentials = Depends(oauth2_scheme),
+    player_id: int = Depends(require_api_key),
     beatmap_id: int = Query(None, alias="id", min=0, max=2_147_483_647),
     nkatu: int = Query(None, max=2_147_483_647),
     ngeki: int = Query(None, max=2_147_483_647),
@@ -135,32 +581,20 @@ async def api_calculate_pp(
     acclist: list[float] = Query([100, 99, 98, 95], alias="acc"),
 ) -> Response:
     """Calculates the PP of a specified map with specified score parameters."""
-
-    if token is None or app.state.sessions.api_keys.get(token.credentials) is None:
-        return ORJSONResponse(
-            {"status": "Invalid API key."},
-            status_code=status.HTTP_401_UNAUTHORIZED,
-        )
-
     beatmap = await Beatmap.from_bid(beatmap_id)
     if not beatmap:
-        return ORJSONResponse(
-            {"status": "Beatmap not found."},
-            status_code=status.HTTP_400_BAD_REQUEST,
-        )
-    if not await ensure_local_osu_file(
-        BEATMAPS_PATH / f"{beatmap.id}.osu",
-        beatmap.id,
-        beatmap.md5,
-    ):
-        return ORJSONResponse(
-            {"status": "Beatmap file could not be fetched."},
-            status_code=status.HTTP_400_BAD_REQUEST,
-        )
+        return status_response(BEATMAP_NOT_FOUND, status.HTTP_400_BAD_REQUEST)
+    osu_file_path = BEATMAPS_PATH / f"{beatmap.id}.osu"
+    osu_file = await fetch_local_osu_file(osu_file_path, beatmap.id, beatmap.md5)
+    if osu_file is None:
+        return status_response(BEATMAP_FILE_UNAVAILABLE, status.HTTP_400_BAD_REQUEST)
+
+    # without any hit counts, we calculate pp for each acc in the acclist
+    use_acclist = ngeki is None and nkatu is None and n100 is None and n50 is None
 
     scores = []
 
-    if all(x is None for x in [ngeki, nkatu, n100, n50]):
+    if use_acclist:
         scores = [
             ScoreParams(GameMode(mode).as_vanilla, mods, combo, acc, nmiss=misses)
             for acc in acclist
@@ -179,9 +613,11 @@ async def api_calculate_pp(
             ),
         )
 
+    # hand over the contents we just verified rather than re-reading them
     results = app.usecases.performance.calculate_performances(
-        str(BEATMAPS_PATH / f"{beatmap.id}.osu"),
+        str(osu_file_path),
         scores,
+        osu_file_contents=osu_file,
     )
 
     # "Inject" the accuracy into the list of results
@@ -192,9 +628,7 @@ async def api_calculate_pp(
 
     return ORJSONResponse(
         # XXX: change the output type based on the inputs from user
-        final_results
-        if all(x is None for x in [ngeki, nkatu, n100, n50])
-        else final_results[0],
+        final_results if use_acclist else final_results[0],
         status_code=status.HTTP_200_OK,  # a list via the acclist parameter or a single score via n100 and n50
     )
 
@@ -202,24 +636,29 @@ async def api_calculate_pp(
 @router.get("/search_players")
 async def api_search_players(
     search: str | None = Query(None, alias="q", min=2, max=32),
-    limit: int | None = Query(10, alias="l", min=1, max=100)
+    limit: int | None = Query(10, alias="l", min=1, max=100),
 ) -> Response:
     """Search for users on the server by name."""
-    rows = await app.state.services.database.fetch_all(
-        "SELECT id, name "
-        "FROM users "
-        "WHERE name LIKE COALESCE(:name, name) "
-        "AND priv & 3 = 3 "
-        "ORDER BY id ASC "
-        "LIMIT :limit",
-        {"name": f"%{search}%" if search is not None else None, "limit": limit},
-    )
+    if search is None:
+        rows = await app.state.services.database.fetch_all(
+            LIST_PLAYERS_QUERY,
+            {"limit": limit},
+        )
+    else:
+        # match names by prefix, so the lookup can use the name index
+        escaped_search = (
+            search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        )
+        rows = await app.state.services.database.fetch_all(
+            SEARCH_PLAYERS_QUERY,
+            {"name": f"{escaped_search}%", "limit": limit},
+        )
 
-    return ORJSONResponse(
+    return json_response(
         {
             "status": "success",
             "results": len(rows),
-            "result": [dict(row) for row in rows],
+            "result": rows,
         },
     )
 
@@ -227,13 +666,21 @@ async def api_search_players(
 @router.get("/get_player_count")
 async def api_get_player_count() -> Response:
     """Get the current amount of online players."""
-    return ORJSONResponse(
+    global total_player_count, total_player_count_expires_at
+
+    # the registered player count changes slowly; only
+    # count the users table every TOTAL_PLAYER_COUNT_TTL
+    if time.monotonic() >= total_player_count_expires_at:
+        total_player_count = await players_repo.fetch_count()
+        total_player_count_expires_at = time.monotonic() + TOTAL_PLAYER_COUNT_TTL
+
+    return json_response(
         {
             "status": "success",
             "counts": {
                 # -1 for the bot, who is always online
                 "online": len(app.state.sessions.players) - 1,
-                "total": await players_repo.fetch_count(),
+                "total": total_player_count,
             },
         },
     )
@@ -243,14 +690,11 @@ async def api_get_player_count() -> Response:
 async def api_get_player_info(
     scope: Literal["ranks", "stats", "info", "all"],
     user_id: int | None = Query(None, alias="id", ge=3, le=2_147_483_647),
-    username: str | None = Query(None, alias="name", pattern=regexes.USERNAME.pattern),
+    username: str | None = Query(None, alias="name", pattern=USERNAME_PATTERN),
 ) -> Response:
     """Return information about a given player."""
     if not (username or user_id) or (username and user_id):
-        return ORJSONResponse(
-            {"status": "Must provide either id OR name!"},
-            status_code=status.HTTP_400_BAD_REQUEST,
-        )
+        return status_response(ID_OR_NAME_REQUIRED, status.HTTP_400_BAD_REQUEST)
 
     # get user info from username or user id
     if username:
@@ -259,78 +703,70 @@ async def api_get_player_info(
         user_info = await players_repo.fetch_one(id=user_id)
 
     if user_info is None:
-        return ORJSONResponse(
-            {"status": "Player not found."},
-            status_code=status.HTTP_404_NOT_FOUND,
-        )
+        return status_response(PLAYER_NOT_FOUND, status.HTTP_404_NOT_FOUND)
 
     resolved_user_id: int = user_info["id"]
     resolved_country: str = user_info["country"]
 
     api_data = {}
-    
+
     # fetch user's info if requested
-    if scope in ("info", "all"):
+    if scope in PLAYER_INFO_SCOPES:
         api_data["info"] = dict(user_info)
         api_data["info"].pop("discord_id", None)
 
     # fetch user's stats if requested
-    if scope in ("stats", "all"):
+    if scope in PLAYER_STATS_SCOPES:
         api_data["stats"] = {}
 
-        # get all stats
-        all_stats = await stats_repo.fetch_many(player_id=resolved_user_id)
-
-        for mode_stats in all_stats:
-            rank = await app.state.services.redis.zrevrank(
-                f"bancho:leaderboard:{mode_stats['mode']}",
+        # queue global & country rank lookups for every mode up front,
+        # so they can run alongside the stats query rather than after it.
+        pipe = app.state.services.redis.pipeline(transaction=False)
+        for mode in GameMode.valid_gamemodes():
+            pipe.zrevrank(
+                f"bancho:leaderboard:{mode.value}",
                 str(resolved_user_id),
             )
-            country_rank = await app.state.services.redis.zrevrank(
-                f"bancho:leaderboard:{mode_stats['mode']}:{resolved_country}",
+            pipe.zrevrank(
+                f"bancho:leaderboard:{mode.value}:{resolved_country}",
                 str(resolved_user_id),
             )
 
+        all_stats, ranks = await asyncio.gather(
+            stats_repo.fetch_many(player_id=resolved_user_id),
+            pipe.execute(),
+        )
+
+        ranks_by_mode = {
+            mode.value: (ranks[i * 2], ranks[i * 2 + 1])
+            for i, mode in enumerate(GameMode.valid_gamemodes())
+        }
+
+        for mode_stats in all_stats:
+            rank, country_rank = ranks_by_mode.get(mode_stats["mode"], (None, None))
+
             # NOTE: this dict-like return is intentional.
             #       but quite cursed.
-            stats_key = str(mode_stats["mode"])
-            api_data["stats"][stats_key] = {
-                "id": mode_stats["id"],
-                "mode": mode_stats["mode"],
-                "tscore": mode_stats["tscore"],
-                "rscore": mode_stats["rscore"],
-                "pp": mode_stats["pp"],
-                "plays": mode_stats["plays"],
-                "playtime": mode_stats["playtime"],
-                "acc": mode_stats["acc"],
-                "max_combo": mode_stats["max_combo"],
-                "total_hits": mode_stats["total_hits"],
-                "replay_views": mode_stats["replay_views"],
-                "xh_count": mode_stats["xh_count"],
-                "x_count": mode_stats["x_count"],
-                "sh_count": mode_stats["sh_count"],
-                "s_count": mode_stats["s_count"],
-                "a_count": mode_stats["a_count"],
-                # extra fields are added to the api response
-                "rank": rank + 1 if rank is not None else 0,
-                "country_rank": country_rank + 1 if country_rank is not None else 0,
-            }
-
-
-    return ORJSONResponse({"status": "success", "player": api_data})
+            mode_data = {key: mode_stats[key] for key in PLAYER_STATS_FIELDS}
+            # extra fields are added to the api response
+            mode_data["rank"] = rank + 1 if rank is not None else 0
+            mode_data["country_rank"] = (
+                country_rank + 1 if country_rank is not None else 0
+            )
+            api_data["stats"][str(mode_stats["mode"])] = mode_data
+
+    return json_response({"status": "success", "player": api_data})
+
 
 # /get_player_whitelist
 # We need id, return did they have whitelist or not
 @router.get("/get_player_whitelist")
 async def api_get_player_whitelist(
     user_id: int | None = Query(None, alias="id", ge=3, le=2_147_483_647),
-    username: str | None = Query(None, alias="name", pattern=regexes.USERNAME.pattern),
+    username: str | None = Query(None, alias="name", pattern=USERNAME_PATTERN),
 ) -> Response:
     if not (username or user_id) or (username and user_id):
-        return ORJSONResponse(
-            {"status": "Must provide either id OR name!"},
-            status_code=status.HTTP_400_BAD_REQUEST,
-        )
+        return status_response(ID_OR_NAME_REQUIRED, status.HTTP_400_BAD_REQUEST)
 
     if username:
         user_info = await players_repo.fetch_one(name=username)
@@ -352,6 +788,7 @@ async def api_get_player_whitelist(
         },
     )
 
+
 # router.get("/vote_beatmap")
 # This API is not for everyone, this api required match osu!api key with config
 # This API Required, discord id, and beatmap set id
@@ -365,85 +802,74 @@ async def api_get_player_whitelist(
 # DO NOT LIMIT DIGTS OF DISCORD ID OR SET ID
 @router.get("/vote_beatmap")
 async def api_vote_beatmap(
-    discord_id: int | None = Query(None, alias="discord_id", ge=100000000000000000, le=999999999999999999),
+    discord_id: int
+    | None = Query(
+        None,
+        alias="discord_id",
+        ge=100000000000000000,
+        le=999999999999999999,
+    ),
     set_id: int | None = Query(None, alias="set_id", ge=0, le=2_147_483_647),
     key: str | None = Query(None, alias="key", min_length=1, max_length=64),
 ) -> Response:
-    # Print discord_id, set_id, and key
-    print(discord_id, set_id, key)
     if not discord_id or not set_id or not key:
         # 400 bad request, response = "Missing required parameters!"
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "Missing required parameters!"
-                },
+                "response": {"message": "Missing required parameters!"},
             },
             status_code=status.HTTP_400_BAD_REQUEST,
         )
 
-    # check did discord id is exist in users table (please check by database)
-    # Please use app.state.services.database.fetch_val
-    user_info = await app.state.services.database.fetch_val(
-        "SELECT * FROM users WHERE discord_id = :discord_id",
-        {"discord_id": discord_id},
-    )
-    print(user_info)
-    if not user_info:
-        # 404 not found, response = "User not found!"
+    if not is_valid_osu_api_key(key):
+        # Sucess = false, 403 forbidden, response = "Invalid osu!api key"
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "User not found!"
-                },
+                "response": {"message": "Invalid osu!api key!"},
             },
-            status_code=status.HTTP_404_NOT_FOUND,
+            status_code=status.HTTP_403_FORBIDDEN,
         )
-    user_info = await players_repo.fetch_one(id=user_info)
 
-    if not user_info["priv"] & (Privileges.NOMINATOR | Privileges.NAT):
-        # 403 forbidden, response = "You are not a nominator or NAT!"
+    # fetch the voter & the mapset in a single round trip; the map
+    # columns are null when the set_id isn't in our database
+    user_info = await app.state.services.database.fetch_one(
+        VOTER_AND_MAPSET_QUERY,
+        {"discord_id": discord_id, "set_id": set_id},
+    )
+    if user_info is None:
+        # 404 not found, response = "User not found!"
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "You are not a nominator or NAT!"
-                },
+                "response": {"message": "User not found!"},
             },
-            status_code=status.HTTP_403_FORBIDDEN,
+            status_code=status.HTTP_404_NOT_FOUND,
         )
-
-    if key != app.settings.OSU_API_KEY:
-        # Sucess = false, 403 forbidden, response = "Invalid osu!api key"
+    if not user_info["priv"] & (Privileges.NOMINATOR | Privileges.NAT):
+        # 403 forbidden, response = "You are not a nominator or NAT!"
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "Invalid osu!api key!"
-                },
+                "response": {"message": "You are not a nominator or NAT!"},
             },
             status_code=status.HTTP_403_FORBIDDEN,
         )
+
     # Check did beatmap set id is already ranked or not
-    # Please use app.state.services.database.fetch_val
     # If status = 2, that mean beatmap is already ranked
     # If status = 3, that mean beatmap is already loved
     # If status = 4, that mean beatmap is already qualified
     # We will vote only if status is 0 or 1
-    beatmap_info = await app.state.services.database.fetch_val(
-        "SELECT status FROM maps WHERE set_id = :set_id",
-        {"set_id": set_id},
-    )
-    if beatmap_info in (2, 3, 4, 5):
+    if user_info["status"] in (2, 3, 4, 5):
         # status is true but response is already ranked, 403 forbidden
         # do like success but do not include vote count and need count
         return ORJSONResponse(
             {
                 "success": False,
                 "response": {
-                    "message": "Beatmap is already ranked, loved, or qualified!"
+                    "message": "Beatmap is already ranked, loved, or qualified!",
                 },
             },
             status_code=status.HTTP_403_FORBIDDEN,
@@ -452,118 +878,87 @@ async def api_vote_beatmap(
         # Check did user already vote or not in redis
         # If user already vote, return error
         # If user not vote, return success
-        # Please use app.state.services.redis.get
         userid = user_info["id"]
-        vote = await app.state.services.redis.get(f"vote:{userid}:{set_id}")
+        # the ids of everyone who voted for a set are kept in one redis set
+        vote_key = f"bancho:map_votes:{set_id}"
+        vote = await cast(
+            Awaitable[int],
+            app.state.services.redis.sismember(vote_key, userid),
+        )
         # If user already vote
         if vote:
             # status is true but response is already voted, 403 forbidden
             # do like success but do not include vote count and need count
             return ORJSONResponse(
                 {
-                        "success": False,
-                        "response": {
-                            "message": "You have already voted this beatmap!"
-                        },
-                    },
+                    "success": False,
+                    "response": {"message": "You have already voted this beatmap!"},
+                },
                 status_code=status.HTTP_403_FORBIDDEN,
             )
         else:
             # Check, did beatmap ever get vote or not
             # If beatmap already get vote, increment vote by 1
             # If beatmap not get vote, set vote to 1 and return like Now beatmap has 1/2 votes for qualification. One more vote is needed!
-            
+
             # Check did beatmap already get vote or not
             # Please use app.state.services.redis.get
             # Check by if end with :set_id, that mean beatmap already get vote
             # If not, that mean beatmap not get vote
             # check did beatmap set_id is exist in database?
-            # Please use app.state.services.database.fetch_val
+            # (the map columns of the joined row are null if not)
             # If not exist, return error
             # If exist, continue
-            beatmap_info = await app.state.services.database.fetch_val(
-                "SELECT set_id FROM maps WHERE set_id = :set_id",
-                {"set_id": set_id},
-            )
-            if not beatmap_info:
+            if user_info["status"] is None:
                 # sucess = false, 404 not found, response = "Beatmap not found"
                 return ORJSONResponse(
                     {
                         "success": False,
                         "response": {
-                            "message": "Beatmap not found! (Please recheck your beatmap set_id!)"
+                            "message": "Beatmap not found! (Please recheck your beatmap set_id!)",
                         },
                     },
                     status_code=status.HTTP_404_NOT_FOUND,
                 )
-            vote_key = f"vote:{userid}:{set_id}"
-            # Define the key pattern
-            vote_key_map = f"vote:*:{set_id}"
-            vote_key_pattern = f"vote:{userid}:{set_id}"
-
-            # Use scan_iter to get an async iterator of keys that match the pattern
-            vote_keys = app.state.services.redis.scan_iter(match=vote_key_pattern)
-            vote_maps = app.state.services.redis.scan_iter(match=vote_key_map)
-            # Create an empty list to store the keys
-            vote_keys_list = []
-            vote_maps_list = []
-            # Use an async for loop to iterate over the async generator
-            async for key in vote_keys:
-                vote_keys_list.append(key)
-            async for key in vote_maps:
-                vote_maps_list.append(key)
-
-            # Initialize vote_count
-            vote_count = None
-
-            # Get the vote count from Redis
-            vote_count = len(vote_maps_list)
-            print(vote_count)
-            if vote_count is None:
-                await app.state.services.redis.set(vote_key, 1)
-                vote_count = '1'
-            elif isinstance(vote_count, int):
-                await app.state.services.redis.incr(vote_key)
-                vote_count = str(vote_count + 1)
-            else:
-                return "Error: vote count is not an integer."
-            print(vote_count)
-            if vote_count == '1':
+            # record the vote & count the set's votes in one round trip
+            pipe = app.state.services.redis.pipeline(transaction=False)
+            pipe.sadd(vote_key, userid)
+            pipe.scard(vote_key)
+            _, vote_count = await pipe.execute()
+            if vote_count == 1:
                 # Send webhook to discord
-                # Getting beatmap info by database
-                beatmap_info = await app.state.services.database.fetch_one(
-                    "SELECT * FROM maps WHERE set_id = :set_id",
-                    {"set_id": set_id},
-                )
-                print(beatmap_info)
                 # Get username of user
                 username = user_info["name"]
                 # We need artist, title, version, creator, and set_id
-                artist = beatmap_info["artist"]
-                title = beatmap_info["title"]
-                creator = beatmap_info["creator"]
+                artist = user_info["artist"]
+                title = user_info["title"]
+                creator = user_info["creator"]
                 # Send to discord webhook nomination
-                webhook = Webhook(url=app.settings.DISCORD_QUALIFIED_WEBHOOK)
-                # Tell beatmap info and clickable link to osu!bancho
-                # like [artist - title (version) by creator](https://osu.ppy.sh/beatmapsets/set_id) has 1/2 votes for qualification. One more vote is needed!
-                embed = Embed(
-                    title="Beatmap Nomination",
-                    description=f"[{artist} - {title} by {creator}](https://osu.ppy.sh/beatmapsets/{set_id}) has 1/2 votes for qualification. (Vote by {username}) One more vote is needed!",
-                    color=0x808080
-                )
-                embed.set_image(url=f"https://assets.ppy.sh/beatmaps/{set_id}/covers/card.jpg")
-                # Send the webhook
-                webhook.add_embed(embed)
-                await webhook.post()
+                if webhook_url := app.settings.DISCORD_QUALIFIED_WEBHOOK:
+                    # Tell beatmap info and clickable link to osu!bancho
+                    # like [artist - title (version) by creator](https://osu.ppy.sh/beatmapsets/set_id) has 1/2 votes for qualification. One more vote is needed!
+                    embed = Embed(
+                        title="Beatmap Nomination",
+                        description=NOMINATED_DESCRIPTION.format(
+                            artist=artist,
+                            title=title,
+                            creator=creator,
+                            set_id=set_id,
+                            username=username,
+                        ),
+                        color=0x808080,
+                    )
+                    embed.set_image(url=BEATMAPSET_COVER_URL.format(set_id=set_id))
+                    queue_webhook_embed(webhook_url, embed)
                 # Make respone like this
-                #{
+                # {
                 #    "status": true,
                 #    "response": {
                 #        "message": "You have nominated this map, this mapset need 1 more vote for qualified status",
                 #        "votes": 1,
                 #        "need" : 1
                 #    }
-                #}
+                # }
                 # status will be true because they are successfully
                 return ORJSONResponse(
                     {
@@ -571,92 +966,92 @@ async def api_vote_beatmap(
                         "response": {
                             "message": "You have nominated this map, this mapset need 1 more vote for qualified status!",
                             "votes": int(vote_count),
-                            "need": 1
+                            "need": 1,
                         },
                     },
                     status_code=status.HTTP_200_OK,
                 )
             else:
-                print(vote_count)
-                print("Qualified")
-                # Qualified beatmap, edit value in database to 4
-                await app.state.services.database.execute(
-                    "UPDATE maps SET status = 4 WHERE set_id = :set_id",
-                    {"set_id": set_id},
-                )
-                # delete vote from redis key
-                await app.state.services.redis.delete(vote_key)
-                # set beatmap change_date to current time
-                await app.state.services.database.execute(
-                    "UPDATE maps SET change_date = now() WHERE set_id = :set_id",
-                    {"set_id": set_id}
-                )
-                    
-                # Get beatmap id, not set id
-                ids = await app.state.services.database.fetch_all(
-                "SELECT id FROM maps WHERE set_id = :set_id",
-                {"set_id": set_id}
-                )
-                for idmap in ids:
-                    print(idmap)
-                    md5 = await app.state.services.database.fetch_val(
-                        "SELECT md5 FROM maps WHERE id = :id",
-                        {"id": idmap}
+                if app.settings.DEBUG:
+                    log(f"Beatmap set {set_id} qualified by votes.", Ansi.LMAGENTA)
+
+                async with app.state.services.database.transaction():
+                    # Qualified beatmap, edit value in database to 4
+                    # & set beatmap change_date to current time
+                    await app.state.services.database.execute(
+                        "UPDATE maps SET status = 4, change_date = now() "
+                        "WHERE set_id = :set_id",
+                        {"set_id": set_id},
                     )
-                    if md5 in app.state.cache.beatmap:
-                        app.state.cache.beatmap[md5].status = 2
-                        app.state.cache.beatmap[md5].frozen = True
-                    # delete request from map_requests (map_id)
+                    # delete requests for any of the set's difficulties
                     await app.state.services.database.execute(
-                        "DELETE FROM map_requests WHERE map_id = :id",
-                        {"id": idmap}
+                        "DELETE FROM map_requests "
+                        "WHERE map_id IN (SELECT id FROM maps WHERE set_id = :set_id)",
+                        {"set_id": set_id},
                     )
-                    
-                # Send to discord webhook
-                # Getting beatmap info by database
-                beatmap_info = await app.state.services.database.fetch_one(
-                    "SELECT * FROM maps WHERE set_id = :set_id",
-                    {"set_id": set_id},
+
+                # schedule the set to be ranked once it's due
+                app.bg_loops.notify_set_qualified()
+
+                # delete vote from redis key
+                await app.state.services.redis.delete(vote_key)
+
+                # update the cached copies of the set's difficulties
+                await update_cached_set_status(
+                    set_id,
+                    status=RankedStatus.Qualified,
+                    frozen=True,
                 )
+
                 # Send to discord webhook qualification
-                
+
                 # We need artist, title, version, creator, and set_id
-                artist = beatmap_info["artist"]
-                title = beatmap_info["title"]
-                creator = beatmap_info["creator"]
+                artist = user_info["artist"]
+                title = user_info["title"]
+                creator = user_info["creator"]
                 # Get username of user
                 username = user_info["name"]
+                description = QUALIFIED_DESCRIPTION.format(
+                    artist=artist,
+                    title=title,
+                    creator=creator,
+                    set_id=set_id,
+                )
+                qualified_at = datetime.datetime.now(datetime.UTC)
                 if webhook_url := app.settings.DISCORD_QUALIFIED_WEBHOOK:
-                    embed = Embed(title="", description=f"[{artist} - {title} ({creator})](https://osu.ppy.sh/beatmapsets/{set_id}) is now qualified! (Lastest vote by {username})", timestamp=datetime.datetime.utcnow(), color=52478)
-                    embed.set_author(name="Automatic Status Bot (Click to get beatmap!)", icon_url="https://a.ppy.sh/1", url=f"https://osu.ppy.sh/beatmapsets/{set_id}")
-                    embed.set_image(url=f"https://assets.ppy.sh/beatmaps/{set_id}/covers/card.jpg")
-                    embed.set_footer(text="Nomination Tools")
-                    embed.color = 0x00FF00
-                    webhook = Webhook(webhook_url, embeds=[embed])
-                await webhook.post()
+                    embed = make_status_embed(
+                        f"{description} (Lastest vote by {username})",
+                        set_id,
+                        colour=0x00FF00,
+                        timestamp=qualified_at,
+                    )
+                    queue_webhook_embed(webhook_url, embed)
                 if webhook_url := app.settings.DISCORD_NOMINATION_WEBHOOK:
-                    embed = Embed(title="", description=f"[{artist} - {title} ({creator})](https://osu.ppy.sh/beatmapsets/{set_id}) is now qualified!", timestamp=datetime.datetime.utcnow(), color=52478)
-                    embed.set_author(name="Automatic Status Bot (Click to get beatmap!)", icon_url="https://a.ppy.sh/1", url=f"https://osu.ppy.sh/beatmapsets/{set_id}")
-                    embed.set_image(url=f"https://assets.ppy.sh/beatmaps/{set_id}/covers/card.jpg")
-                    embed.set_footer(text="Nomination Tools")
-                    embed.color = 0x00FF00
-                    webhook = Webhook(webhook_url, embeds=[embed])
-                await webhook.post()
-                    
+                    embed = make_status_embed(
+                        description,
+                        set_id,
+                        colour=0x00FF00,
+                        timestamp=qualified_at,
+                    )
+                    queue_webhook_embed(webhook_url, embed)
+
                 return ORJSONResponse(
                     {
                         "success": True,
                         "response": {
                             "message": "You have nominated this map, this mapset has been qualified!",
                             "votes": int(vote_count),
-                            "need": 0
+                            "need": 0,
                         },
                     },
                     status_code=status.HTTP_200_OK,
                 )
+
+
 # Give me example of api
 # /vote_beatmap?discord_id=736163902835916880&set_id=772
 
+
 # /love_beatmap, only for NAT, need discord id and set id and osu!api key that match with config
 # they kinda same with vote beatmap, but this is for loved beatmap, and no need to vote, if beatmap is already love, return error, if beatmap is already ranked, return error
 # If discord id is is not exist in users table, return error
@@ -668,164 +1063,102 @@ async def api_vote_beatmap(
 # Also discord userid is 18 digit, if not return error
 @router.get("/love_beatmap")
 async def api_love_beatmap(
-    discord_id: int | None = Query(None, alias="discord_id", ge=100000000000000000, le=999999999999999999),
     set_id: int | None = Query(None, alias="set_id", ge=0, le=2_147_483_647),
-    key: str | None = Query(None, alias="key", min_length=1, max_length=64),
+    user_info: players_repo.Player = Depends(require_nat),
 ) -> Response:
-    # Print discord_id, set_id, and key
-    print(discord_id, set_id, key)
-    if not discord_id or not set_id or not key:
+    if not set_id:
         # 400 bad request, response = "Missing required parameters!"
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "Missing required parameters!"
-                },
+                "response": {"message": "Missing required parameters!"},
             },
             status_code=status.HTTP_400_BAD_REQUEST,
         )
 
-    # check did discord id is exist in users table (please check by database)
-    # Please use app.state.services.database.fetch_val
-    user_info = await app.state.services.database.fetch_val(
-        "SELECT * FROM users WHERE discord_id = :discord_id",
-        {"discord_id": discord_id},
+    mapset_info = await app.state.services.database.fetch_one(
+        MAPSET_QUERY,
+        {"set_id": set_id},
     )
-    print(user_info)
-    if not user_info:
-        # 404 not found, response = "User not found!"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "User not found!"
-                },
-            },
-            status_code=status.HTTP_404_NOT_FOUND,
-        )
-    user_info = await players_repo.fetch_one(id=user_info)
-
-    if not user_info["priv"] & Privileges.NAT:
-        # 403 forbidden, response = "You are not a NAT!"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "You are not a NAT!"
-                },
-            },
-            status_code=status.HTTP_403_FORBIDDEN,
-        )
-
-    if key != app.settings.OSU_API_KEY:
-        # Sucess = false, 403 forbidden, response = "Invalid osu!api key"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "Invalid osu!api key!"
-                },
-            },
-            status_code=status.HTTP_403_FORBIDDEN,
-        )
     # Check did beatmap set id is already ranked or not
-    # Please use app.state.services.database.fetch_val
     # If status = 2, that mean beatmap is already ranked
     # If status = 3, that mean beatmap is already loved
     # If status = 4, that mean beatmap is already qualified
     # We will vote only if status is 0 or 1
-    beatmap_info = await app.state.services.database.fetch_val(
-        "SELECT status FROM maps WHERE set_id = :set_id",
-        {"set_id": set_id},
-    )
-    if beatmap_info in (2, 3, 4, 5):
+    if mapset_info is not None and mapset_info["status"] in (2, 3, 4, 5):
         # status is true but response is already ranked, 403 forbidden
         # do like success but do not include vote count and need count
         return ORJSONResponse(
             {
                 "success": False,
                 "response": {
-                    "message": "Beatmap is already ranked, loved, or qualified!"
+                    "message": "Beatmap is already ranked, loved, or qualified!",
                 },
             },
             status_code=status.HTTP_403_FORBIDDEN,
         )
     else:
         # Check did beatmap set id is exist in database?
-        # Please use app.state.services.database.fetch_val
         # If not exist, return error
         # If exist, continue
-        beatmap_info = await app.state.services.database.fetch_val(
-            "SELECT set_id FROM maps WHERE set_id = :set_id",
-            {"set_id": set_id},
-        )
-        if not beatmap_info:
+        if mapset_info is None:
             # sucess = false, 404 not found, response = "Beatmap not found"
             return ORJSONResponse(
                 {
                     "success": False,
                     "response": {
-                        "message": "Beatmap not found! (Please recheck your beatmap set_id!)"
+                        "message": "Beatmap not found! (Please recheck your beatmap set_id!)",
                     },
                 },
                 status_code=status.HTTP_404_NOT_FOUND,
             )
         # Loveable beatmap, edit value in database to 5
-        print(set_id)
-        await app.state.services.database.execute(
-            "UPDATE maps SET status = 5 WHERE set_id = :set_id",
-            {"set_id": set_id},
-        )
-        print("Loved")
-        # set beatmap change_date to current time
-        await app.state.services.database.execute(
-            "UPDATE maps SET change_date = now() WHERE set_id = :set_id",
-            {"set_id": set_id}
-        )
-        # Get beatmap id, not set id
-        ids = await app.state.services.database.fetch_all(
-        "SELECT id FROM maps WHERE set_id = :set_id",
-        {"set_id": set_id}
-        )
-        for idmap in ids:
-            idmap = idmap["id"]
-            print(idmap)
-            md5 = await app.state.services.database.fetch_val(
-                "SELECT md5 FROM maps WHERE id = :id",
-                {"id": idmap}
+        if app.settings.DEBUG:
+            log(f"Beatmap set {set_id} loved by {user_info['name']}.", Ansi.LMAGENTA)
+
+        async with app.state.services.database.transaction():
+            # update the set's status & set change_date to current time
+            await app.state.services.database.execute(
+                "UPDATE maps SET status = 5, frozen = 1, change_date = now() "
+                "WHERE set_id = :set_id",
+                {"set_id": set_id},
             )
-            # update map by map_id
-            await maps_repo.update(idmap, status=5, frozen=True)
-            if md5 in app.state.cache.beatmap:
-                app.state.cache.beatmap[md5].status = 5
-                app.state.cache.beatmap[md5].frozen = True
-            # delete request from map_requests (map_id)
+            # delete requests for any of the set's difficulties
             await app.state.services.database.execute(
-                "DELETE FROM map_requests WHERE map_id = :id",
-                {"id": idmap}
+                "DELETE FROM map_requests "
+                "WHERE map_id IN (SELECT id FROM maps WHERE set_id = :set_id)",
+                {"set_id": set_id},
             )
-        # Send to discord webhook
-        # Getting beatmap info by database
-        beatmap_info = await app.state.services.database.fetch_one(
-            "SELECT * FROM maps WHERE set_id = :set_id",
-            {"set_id": set_id},
+
+        # update the cached copies of the set's difficulties
+        await update_cached_set_status(
+            set_id,
+            status=RankedStatus.Loved,
+            frozen=True,
         )
         # Send to discord webhook nomination
         # We need artist, title, version, creator, and set_id
-        artist = beatmap_info["artist"]
-        title = beatmap_info["title"]
-        creator = beatmap_info["creator"]
+        artist = mapset_info["artist"]
+        title = mapset_info["title"]
+        creator = mapset_info["creator"]
         # Get username of user
         username = user_info["name"]
+        description = STATUS_CHANGE_DESCRIPTION.format(
+            artist=artist,
+            title=title,
+            creator=creator,
+            set_id=set_id,
+            status="loved",
+        )
+        changed_at = datetime.datetime.now(datetime.UTC)
         if webhook_url := app.settings.DISCORD_NOMINATION_WEBHOOK:
-            embed = Embed(title="", description=f"[{artist} - {title} ({creator})](https://osu.ppy.sh/beatmapsets/{set_id}) is now loved! (by {username})", timestamp=datetime.datetime.utcnow(), color=52478)
-            embed.set_author(name="Automatic Status Bot (Click to get beatmap!)", icon_url="https://a.ppy.sh/1", url=f"https://osu.ppy.sh/beatmapsets/{set_id}")
-            embed.set_image(url=f"https://assets.ppy.sh/beatmaps/{set_id}/covers/card.jpg")
-            embed.set_footer(text="Nomination Tools")
-            embed.color = 0xFF69B4
-            webhook = Webhook(webhook_url, embeds=[embed])
-        await webhook.post()
+            embed = make_status_embed(
+                f"{description} (by {username})",
+                set_id,
+                colour=STATUS_CHANGE_COLOURS["loved"],
+                timestamp=changed_at,
+            )
+            queue_webhook_embed(webhook_url, embed)
         return ORJSONResponse(
             {
                 "success": True,
@@ -835,171 +1168,109 @@ async def api_love_beatmap(
             },
             status_code=status.HTTP_200_OK,
         )
+
+
 # Give me example of api
 # /love_beatmap?discord_id=736163902835916880&set_id=772?key=osu!api key
 
+
 # /rank_beatmap, only for NAT, need discord id and set id and osu!api key that match with config
 # they kinda same with love_beatmap, but this is for ranked beatmap, and no need to vote, if beatmap is already love, return error, if beatmap is already ranked, return error
 @router.get("/rank_beatmap")
 async def api_rank_beatmap(
-    discord_id: int | None = Query(None, alias="discord_id", ge=100000000000000000, le=999999999999999999),
     set_id: int | None = Query(None, alias="set_id", ge=0, le=2_147_483_647),
-    key: str | None = Query(None, alias="key", min_length=1, max_length=64),
+    user_info: players_repo.Player = Depends(require_nat),
 ) -> Response:
-    # Print discord_id, set_id, and key
-    print(discord_id, set_id, key)
-    if not discord_id or not set_id or not key:
+    if not set_id:
         # 400 bad request, response = "Missing required parameters!"
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "Missing required parameters!"
-                },
+                "response": {"message": "Missing required parameters!"},
             },
             status_code=status.HTTP_400_BAD_REQUEST,
         )
 
-    # check did discord id is exist in users table (please check by database)
-    # Please use app.state.services.database.fetch_val
-    user_info = await app.state.services.database.fetch_val(
-        "SELECT * FROM users WHERE discord_id = :discord_id",
-        {"discord_id": discord_id},
+    mapset_info = await app.state.services.database.fetch_one(
+        MAPSET_QUERY,
+        {"set_id": set_id},
     )
-    print(user_info)
-    if not user_info:
-        # 404 not found, response = "User not found!"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "User not found!"
-                },
-            },
-            status_code=status.HTTP_404_NOT_FOUND,
-        )
-    user_info = await players_repo.fetch_one(id=user_info)
-
-    if not user_info["priv"] & Privileges.NAT:
-        # 403 forbidden, response = "You are not a NAT!"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "You are not a NAT!"
-                },
-            },
-            status_code=status.HTTP_403_FORBIDDEN,
-        )
-
-    if key != app.settings.OSU_API_KEY:
-        # Sucess = false, 403 forbidden, response = "Invalid osu!api key"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "Invalid osu!api key!"
-                },
-            },
-            status_code=status.HTTP_403_FORBIDDEN,
-        )
     # Check did beatmap set id is already ranked or not
-    # Please use app.state.services.database.fetch_val
     # If status = 2, that mean beatmap is already ranked
     # If status = 4, that mean beatmap is already qualified
     # We will vote only if status is 0 or 1
-    beatmap_info = await app.state.services.database.fetch_val(
-        "SELECT status FROM maps WHERE set_id = :set_id",
-        {"set_id": set_id},
-    )
-    if beatmap_info in (2, 4, 5):
+    if mapset_info is not None and mapset_info["status"] in (2, 4, 5):
         # status is true but response is already ranked, 403 forbidden
         # do like success but do not include vote count and need count
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "Beatmap is already ranked, or qualified!"
-                },
+                "response": {"message": "Beatmap is already ranked, or qualified!"},
             },
             status_code=status.HTTP_403_FORBIDDEN,
         )
     else:
         # Check did beatmap set id is exist in database?
-        # Please use app.state.services.database.fetch_val
         # If not exist, return error
         # If exist, continue
-        beatmap_info = await app.state.services.database.fetch_val(
-            "SELECT set_id FROM maps WHERE set_id = :set_id",
-            {"set_id": set_id},
-        )
-        if not beatmap_info:
+        if mapset_info is None:
             # sucess = false, 404 not found, response = "Beatmap not found"
             return ORJSONResponse(
                 {
                     "success": False,
                     "response": {
-                        "message": "Beatmap not found! (Please recheck your beatmap set_id!)"
+                        "message": "Beatmap not found! (Please recheck your beatmap set_id!)",
                     },
                 },
                 status_code=status.HTTP_404_NOT_FOUND,
             )
         # Loveable beatmap, edit value in database to 2
-        print(set_id)
-        await app.state.services.database.execute(
-            "UPDATE maps SET status = 2 WHERE set_id = :set_id",
-            {"set_id": set_id},
-        )
-        print("Ranked")
-        # set beatmap change_date to current time
-        await app.state.services.database.execute(
-            "UPDATE maps SET change_date = now() WHERE set_id = :set_id",
-            {"set_id": set_id}
-        )
-        # Get beatmap id, not set id
-        ids = await app.state.services.database.fetch_all(
-        "SELECT id FROM maps WHERE set_id = :set_id",
-        {"set_id": set_id}
-        )
-        for idmap in ids:
-            idmap = idmap["id"]
-            print(idmap)
-            md5 = await app.state.services.database.fetch_val(
-                "SELECT md5 FROM maps WHERE id = :id",
-                {"id": idmap}
+        if app.settings.DEBUG:
+            log(f"Beatmap set {set_id} ranked by {user_info['name']}.", Ansi.LMAGENTA)
+
+        async with app.state.services.database.transaction():
+            # update the set's status & set change_date to current time
+            await app.state.services.database.execute(
+                "UPDATE maps SET status = 2, frozen = 1, change_date = now() "
+                "WHERE set_id = :set_id",
+                {"set_id": set_id},
             )
-            # update map by map_id
-            await maps_repo.update(idmap, status=2, frozen=True)
-            if md5 in app.state.cache.beatmap:
-                app.state.cache.beatmap[md5].status = 2
-                app.state.cache.beatmap[md5].frozen = True
-            # delete request from map_requests (map_id)
+            # delete requests for any of the set's difficulties
             await app.state.services.database.execute(
-                "DELETE FROM map_requests WHERE map_id = :id",
-                {"id": idmap}
+                "DELETE FROM map_requests "
+                "WHERE map_id IN (SELECT id FROM maps WHERE set_id = :set_id)",
+                {"set_id": set_id},
             )
-        # Send to discord webhook
-        # Getting beatmap info by database
-        beatmap_info = await app.state.services.database.fetch_one(
-            "SELECT * FROM maps WHERE set_id = :set_id",
-            {"set_id": set_id},
+
+        # update the cached copies of the set's difficulties
+        await update_cached_set_status(
+            set_id,
+            status=RankedStatus.Ranked,
+            frozen=True,
         )
         # Send to discord webhook nomination
         # We need artist, title, version, creator, and set_id
-        artist = beatmap_info["artist"]
-        title = beatmap_info["title"]
-        creator = beatmap_info["creator"]
+        artist = mapset_info["artist"]
+        title = mapset_info["title"]
+        creator = mapset_info["creator"]
         # Get username of user
         username = user_info["name"]
+        description = STATUS_CHANGE_DESCRIPTION.format(
+            artist=artist,
+            title=title,
+            creator=creator,
+            set_id=set_id,
+            status="ranked",
+        )
+        changed_at = datetime.datetime.now(datetime.UTC)
         if webhook_url := app.settings.DISCORD_NOMINATION_WEBHOOK:
-            embed = Embed(title="", description=f"[{artist} - {title} ({creator})](https://osu.ppy.sh/beatmapsets/{set_id}) is now ranked! (by {username})", timestamp=datetime.datetime.utcnow(), color=52478)
-            embed.set_author(name="Automatic Status Bot (Click to get beatmap!)", icon_url="https://a.ppy.sh/1", url=f"https://osu.ppy.sh/beatmapsets/{set_id}")
-            embed.set_image(url=f"https://assets.ppy.sh/beatmaps/{set_id}/covers/card.jpg")
-            embed.set_footer(text="Nomination Tools")
-            # Blue color
-            embed.color = 0x0000FF
-            webhook = Webhook(webhook_url, embeds=[embed])
-        await webhook.post()
+            embed = make_status_embed(
+                f"{description} (by {username})",
+                set_id,
+                colour=STATUS_CHANGE_COLOURS["ranked"],
+                timestamp=changed_at,
+            )
+            queue_webhook_embed(webhook_url, embed)
         return ORJSONResponse(
             {
                 "success": True,
@@ -1009,183 +1280,123 @@ async def api_rank_beatmap(
             },
             status_code=status.HTTP_200_OK,
         )
+
+
 # Give me example of api
 # /rank_beatmap?discord_id=736163902835916880&set_id=772
 
+
 # /cancel_beatmap, only for NAT, need discord id and set id and osu!api key that match with config
 # cancel beatmap is for cancel beatmap it going qualified in soon, by deleting all beatmapset id in database
 # if beatmap is already love, return error, if beatmap is already ranked, return error
 @router.get("/cancel_beatmap")
 async def api_cancel_beatmap(
-    discord_id: int | None = Query(None, alias="discord_id", ge=100000000000000000, le=999999999999999999),
     set_id: int | None = Query(None, alias="set_id", ge=0, le=2_147_483_647),
-    key: str | None = Query(None, alias="key", min_length=1, max_length=64),
+    user_info: players_repo.Player = Depends(require_nat),
 ) -> Response:
-    # Print discord_id, set_id, and key
-    print(discord_id, set_id, key)
-    if not discord_id or not set_id or not key:
+    if not set_id:
         # 400 bad request, response = "Missing required parameters!"
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "Missing required parameters!"
-                },
+                "response": {"message": "Missing required parameters!"},
             },
             status_code=status.HTTP_400_BAD_REQUEST,
         )
 
-    # check did discord id is exist in users table (please check by database)
-    # Please use app.state.services.database.fetch_val
-    user_info = await app.state.services.database.fetch_val(
-        "SELECT * FROM users WHERE discord_id = :discord_id",
-        {"discord_id": discord_id},
+    mapset_info = await app.state.services.database.fetch_one(
+        MAPSET_QUERY,
+        {"set_id": set_id},
     )
-    print(user_info)
-    if not user_info:
-        # 404 not found, response = "User not found!"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "User not found!"
-                },
-            },
-            status_code=status.HTTP_404_NOT_FOUND,
-        )
-    user_info = await players_repo.fetch_one(id=user_info)
-
-    if not user_info["priv"] & Privileges.NAT:
-        # 403 forbidden, response = "You are not a NAT!"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "You are not a NAT!"
-                },
-            },
-            status_code=status.HTTP_403_FORBIDDEN,
-        )
-
-    if key != app.settings.OSU_API_KEY:
-        # Sucess = false, 403 forbidden, response = "Invalid osu!api key"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "Invalid osu!api key!"
-                },
-            },
-            status_code=status.HTTP_403_FORBIDDEN,
-        )
     # Check did beatmap set id is already ranked or not
-    # Please use app.state.services.database.fetch_val
     # If status = 2, that mean beatmap is already ranked
     # If status = 3, that mean beatmap is already loved
     # If status = 4, that mean beatmap is already qualified
     # We will vote only if status is 0 or 1
-    beatmap_info = await app.state.services.database.fetch_val(
-        "SELECT status FROM maps WHERE set_id = :set_id",
-        {"set_id": set_id},
-    )
-    if beatmap_info in (2, 3, 5):
+    if mapset_info is not None and mapset_info["status"] in (2, 3, 5):
         # status is true but response is already ranked, 403 forbidden
         # do like success but do not include vote count and need count
         return ORJSONResponse(
             {
                 "success": False,
                 "response": {
-                    "message": "Beatmap is already ranked, loved, or qualified!"
+                    "message": "Beatmap is already ranked, loved, or qualified!",
                 },
             },
             status_code=status.HTTP_403_FORBIDDEN,
         )
     else:
         # Check did beatmap set id is exist in database?
-        # Please use app.state.services.database.fetch_val
         # If not exist, return error
         # If exist, continue
-        beatmap_info = await app.state.services.database.fetch_val(
-            "SELECT set_id FROM maps WHERE set_id = :set_id",
-            {"set_id": set_id},
-        )
-        if not beatmap_info:
+        if mapset_info is None:
             # sucess = false, 404 not found, response = "Beatmap not found"
             return ORJSONResponse(
                 {
                     "success": False,
                     "response": {
-                        "message": "Beatmap not found! (Please recheck your beatmap set_id!)"
+                        "message": "Beatmap not found! (Please recheck your beatmap set_id!)",
                     },
                 },
                 status_code=status.HTTP_404_NOT_FOUND,
             )
         # Loveable beatmap, edit value in database to 0
-        print(set_id)
-        await app.state.services.database.execute(
-            "UPDATE maps SET status = 0 WHERE set_id = :set_id",
-            {"set_id": set_id},
-        )
-        print("Canceled")
-        # set beatmap change_date to current time
-        await app.state.services.database.execute(
-            "UPDATE maps SET change_date = now() WHERE set_id = :set_id",
-            {"set_id": set_id}
-        )
-        # Get beatmap id, not set id
-        ids = await app.state.services.database.fetch_all(
-        "SELECT id FROM maps WHERE set_id = :set_id",
-        {"set_id": set_id}
-        )
-        for idmap in ids:
-            idmap = idmap["id"]
-            print(idmap)
-            md5 = await app.state.services.database.fetch_val(
-                "SELECT md5 FROM maps WHERE id = :id",
-                {"id": idmap}
+        if app.settings.DEBUG:
+            log(f"Beatmap set {set_id} canceled by {user_info['name']}.", Ansi.LMAGENTA)
+
+        async with app.state.services.database.transaction():
+            # update the set's status & set change_date to current time
+            await app.state.services.database.execute(
+                "UPDATE maps SET status = 0, frozen = 0, change_date = now() "
+                "WHERE set_id = :set_id",
+                {"set_id": set_id},
             )
-            # update map by map_id
-            await maps_repo.update(idmap, status=0, frozen=False)
-            if md5 in app.state.cache.beatmap:
-                app.state.cache.beatmap[md5].status = 0
-                app.state.cache.beatmap[md5].frozen = False
-            # delete request from map_requests (map_id)
+            # delete requests for any of the set's difficulties
             await app.state.services.database.execute(
-                "DELETE FROM map_requests WHERE map_id = :id",
-                {"id": idmap}
+                "DELETE FROM map_requests "
+                "WHERE map_id IN (SELECT id FROM maps WHERE set_id = :set_id)",
+                {"set_id": set_id},
             )
-        # Send to discord webhook
-        # Getting beatmap info by database
-        beatmap_info = await app.state.services.database.fetch_one(
-            "SELECT * FROM maps WHERE set_id = :set_id",
-            {"set_id": set_id},
+
+        # update the cached copies of the set's difficulties
+        await update_cached_set_status(
+            set_id,
+            status=RankedStatus.Pending,
+            frozen=False,
         )
         # Send to discord webhook nomination
         # We need artist, title, version, creator, and set_id
-        artist = beatmap_info["artist"]
-        title = beatmap_info["title"]
-        creator = beatmap_info["creator"]
+        artist = mapset_info["artist"]
+        title = mapset_info["title"]
+        creator = mapset_info["creator"]
         # Get username of user
         username = user_info["name"]
+        description = STATUS_CHANGE_DESCRIPTION.format(
+            artist=artist,
+            title=title,
+            creator=creator,
+            set_id=set_id,
+            status="canceled",
+        )
+        changed_at = datetime.datetime.now(datetime.UTC)
         if webhook_url := app.settings.DISCORD_NOMINATION_WEBHOOK:
-            embed = Embed(title="", description=f"[{artist} - {title} ({creator})](https://osu.ppy.sh/beatmapsets/{set_id}) is now canceled! (by {username})", timestamp=datetime.datetime.utcnow(), color=52478)
-            embed.set_author(name="Automatic Status Bot (Click to get beatmap!)", icon_url="https://a.ppy.sh/1", url=f"https://osu.ppy.sh/beatmapsets/{set_id}")
-            embed.set_image(url=f"https://assets.ppy.sh/beatmaps/{set_id}/covers/card.jpg")
-            embed.set_footer(text="Nomination Tools")
-            # Red color
-            embed.color = 0xFF0000
-            webhook = Webhook(webhook_url, embeds=[embed])
-        await webhook.post()
+            embed = make_status_embed(
+                f"{description} (by {username})",
+                set_id,
+                colour=STATUS_CHANGE_COLOURS["canceled"],
+                timestamp=changed_at,
+            )
+            queue_webhook_embed(webhook_url, embed)
         # Send to discord webhook qualification
         if webhook_url := app.settings.DISCORD_QUALIFIED_WEBHOOK:
-            embed = Embed(title="", description=f"[{artist} - {title} ({creator})](https://osu.ppy.sh/beatmapsets/{set_id}) is now canceled!", timestamp=datetime.datetime.utcnow(), color=52478)
-            embed.set_author(name="Automatic Status Bot (Click to get beatmap!)", icon_url="https://a.ppy.sh/1", url=f"https://osu.ppy.sh/beatmapsets/{set_id}")
-            embed.set_image(url=f"https://assets.ppy.sh/beatmaps/{set_id}/covers/card.jpg")
-            embed.set_footer(text="Nomination Tools")
-            # Red color
-            embed.color = 0xFF0000
-            webhook = Webhook(webhook_url, embeds=[embed])
-        await webhook.post()
+            embed = make_status_embed(
+                description,
+                set_id,
+                colour=STATUS_CHANGE_COLOURS["canceled"],
+                timestamp=changed_at,
+            )
+            queue_webhook_embed(webhook_url, embed)
+
         return ORJSONResponse(
             {
                 "success": True,
@@ -1195,90 +1406,39 @@ async def api_cancel_beatmap(
             },
             status_code=status.HTTP_200_OK,
         )
+
+
 # Give me example of api
 # /cancel_beatmap?discord_id=736163902835916880&set_id=772
 
+
 # /restrict_player, only for Staff, need discord id and osu!api key that match with config
 # restrict player is for restrict player from playing, if player is already restricted, return error
 # discord_id for staff, player name is target player to restrict, and reason is reason to restrict player
 # target = await app.state.sessions.players.from_cache_or_sql(name=username)
 @router.get("/restrict_player")
 async def api_restrict_player(
-    discord_id: int | None = Query(None, alias="discord_id", ge=100000000000000000, le=999999999999999999),
-    username: str | None = Query(None, alias="username", pattern=regexes.USERNAME.pattern),
+    username: str | None = Query(None, alias="username", pattern=USERNAME_PATTERN),
     reason: str | None = Query(None, alias="reason", min_length=1, max_length=128),
-    key: str | None = Query(None, alias="key", min_length=1, max_length=64),
+    user_info: players_repo.Player = Depends(require_staff),
 ) -> Response:
-    # Print discord_id, username, reason, and key
-    print(discord_id, username, reason, key)
-    if not discord_id or not username or not reason or not key:
+    if not username or not reason:
         # 400 bad request, response = "Missing required parameters!"
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "Missing required parameters!"
-                },
+                "response": {"message": "Missing required parameters!"},
             },
             status_code=status.HTTP_400_BAD_REQUEST,
         )
-
-    # check did discord id is exist in users table (please check by database)
-    # Please use app.state.services.database.fetch_val
-    user_info = await app.state.services.database.fetch_val(
-        "SELECT * FROM users WHERE discord_id = :discord_id",
-        {"discord_id": discord_id},
-    )
-    print(user_info)
-    if not user_info:
-        # 404 not found, response = "User not found!"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "User not found!"
-                },
-            },
-            status_code=status.HTTP_404_NOT_FOUND,
-        )
-    user_info = await players_repo.fetch_one(id=user_info)
-
-    if not user_info["priv"] & Privileges.STAFF:
-        # 403 forbidden, response = "You are not a Staff!"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "You are not a Staff!"
-                },
-            },
-            status_code=status.HTTP_403_FORBIDDEN,
-        )
-
-    if key != app.settings.OSU_API_KEY:
-        # Sucess = false, 403 forbidden, response = "Invalid osu!api key"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "Invalid osu!api key!"
-                },
-            },
-            status_code=status.HTTP_403_FORBIDDEN,
-        )
     # Check did player is already restricted or not
-    # Please use app.state.services.database.fetch_val
-    # If status = 0, that mean player is not restricted
-    # If status = 1, that mean player is restricted
-    # We will restrict only if status is 0
+    # (read from the player object itself, no separate query needed)
     target = await app.state.sessions.players.from_cache_or_sql(name=username)
     if not target:
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "Player not found!"
-                },
+                "response": {"message": "Player not found!"},
             },
             status_code=status.HTTP_404_NOT_FOUND,
         )
@@ -1287,9 +1447,7 @@ async def api_restrict_player(
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "You can't restrict staff or developer!"
-                },
+                "response": {"message": "You can't restrict staff or developer!"},
             },
             status_code=status.HTTP_403_FORBIDDEN,
         )
@@ -1298,9 +1456,7 @@ async def api_restrict_player(
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "You can't restrict yourself!"
-                },
+                "response": {"message": "You can't restrict yourself!"},
             },
             status_code=status.HTTP_403_FORBIDDEN,
         )
@@ -1309,15 +1465,13 @@ async def api_restrict_player(
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "Player is already restricted!"
-                },
+                "response": {"message": "Player is already restricted!"},
             },
             status_code=status.HTTP_403_FORBIDDEN,
         )
     # Restrict player
     # Getting admin info
-    admin = await app.state.sessions.players.from_cache_or_sql(name=user_info["name"])
+    admin = await app.state.sessions.players.from_cache_or_sql(id=user_info["id"])
     await target.restrict(admin=admin, reason=reason)
     # refresh thier client state
     if target.is_online:
@@ -1325,95 +1479,41 @@ async def api_restrict_player(
     return ORJSONResponse(
         {
             "success": True,
-            "response": {
-                "message": "Player has been restricted!",
-                "reason" : reason
-            },
+            "response": {"message": "Player has been restricted!", "reason": reason},
         },
         status_code=status.HTTP_200_OK,
     )
+
+
 # Give me example of api
-# /restrict_player?discord_id=736163902835916880&username=Koi&reason=Bad%20player      
+# /restrict_player?discord_id=736163902835916880&username=Koi&reason=Bad%20player
+
 
-#/unrestrict_player, only for Staff, need discord id and osu!api key that match with config
+# /unrestrict_player, only for Staff, need discord id and osu!api key that match with config
 # same with restrict player, but this is for unrestrict player
 @router.get("/unrestrict_player")
 async def api_unrestrict_player(
-    discord_id: int | None = Query(None, alias="discord_id", ge=100000000000000000, le=999999999999999999),
-    username: str | None = Query(None, alias="username", pattern=regexes.USERNAME.pattern),
+    username: str | None = Query(None, alias="username", pattern=USERNAME_PATTERN),
     reason: str | None = Query(None, alias="reason", min_length=1, max_length=128),
-    key: str | None = Query(None, alias="key", min_length=1, max_length=64),
+    user_info: players_repo.Player = Depends(require_staff),
 ) -> Response:
-    # Print discord_id, username, reason, and key
-    print(discord_id, username, reason, key)
-    if not discord_id or not username or not reason or not key:
+    if not username or not reason:
         # 400 bad request, response = "Missing required parameters!"
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "Missing required parameters!"
-                },
+                "response": {"message": "Missing required parameters!"},
             },
             status_code=status.HTTP_400_BAD_REQUEST,
         )
-
-    # check did discord id is exist in users table (please check by database)
-    # Please use app.state.services.database.fetch_val
-    user_info = await app.state.services.database.fetch_val(
-        "SELECT * FROM users WHERE discord_id = :discord_id",
-        {"discord_id": discord_id},
-    )
-    print(user_info)
-    if not user_info:
-        # 404 not found, response = "User not found!"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "User not found!"
-                },
-            },
-            status_code=status.HTTP_404_NOT_FOUND,
-        )
-    user_info = await players_repo.fetch_one(id=user_info)
-
-    if not user_info["priv"] & Privileges.STAFF:
-        # 403 forbidden, response = "You are not a Staff!"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "You are not a Staff!"
-                },
-            },
-            status_code=status.HTTP_403_FORBIDDEN,
-        )
-
-    if key != app.settings.OSU_API_KEY:
-        # Sucess = false, 403 forbidden, response = "Invalid osu!api key"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "Invalid osu!api key!"
-                },
-            },
-            status_code=status.HTTP_403_FORBIDDEN,
-        )
     # Check did player is already restricted or not
-    # Please use app.state.services.database.fetch_val
-    # If status = 0, that mean player is not restricted
-    # If status = 1, that mean player is restricted
-    # We will restrict only if status is 0
+    # (read from the player object itself, no separate query needed)
     target = await app.state.sessions.players.from_cache_or_sql(name=username)
     if not target:
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "Player not found!"
-                },
+                "response": {"message": "Player not found!"},
             },
             status_code=status.HTTP_404_NOT_FOUND,
         )
@@ -1422,192 +1522,176 @@ async def api_unrestrict_player(
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "Player is not restricted!"
-                },
+                "response": {"message": "Player is not restricted!"},
             },
             status_code=status.HTTP_403_FORBIDDEN,
         )
     # Unrestrict player
     # Getting admin info
-    admin = await app.state.sessions.players.from_cache_or_sql(name=user_info["name"])
+    admin = await app.state.sessions.players.from_cache_or_sql(id=user_info["id"])
     await target.unrestrict(admin=admin, reason=reason)
     return ORJSONResponse(
         {
             "success": True,
-            "response": {
-                "message": "Player has been unrestricted!",
-                "reason" : reason
-            },
+            "response": {"message": "Player has been unrestricted!", "reason": reason},
         },
         status_code=status.HTTP_200_OK,
     )
+
+
 # Give me example of api
 # /unrestrict_player?discord_id=736163902835916880&username=Koi&reason=Bad%20player
 
-#/whitelist_player, only for Staff, need discord id and osu!api key that match with config
+
+# /whitelist_player, only for Staff, need discord id and osu!api key that match with config
 # We need only discord_id of staff, username of player, osu!api key to verify, it is, no any other parameters need
 # If player is already whitelisted, return error
 @router.get("/whitelist_player")
 async def api_whitelist_player(
-    discord_id: int | None = Query(None, alias="discord_id", ge=100000000000000000, le=999999999999999999),
-    username: str | None = Query(None, alias="username", pattern=regexes.USERNAME.pattern),
-    key: str | None = Query(None, alias="key", min_length=1, max_length=64),
+    username: str | None = Query(None, alias="username", pattern=USERNAME_PATTERN),
+    user_info: players_repo.Player = Depends(require_staff),
 ) -> Response:
-    # Print discord_id, username, and key
-    print(discord_id, username, key)
-    if not discord_id or not username or not key:
+    if not username:
         # 400 bad request, response = "Missing required parameters!"
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "Missing required parameters!"
-                },
+                "response": {"message": "Missing required parameters!"},
             },
             status_code=status.HTTP_400_BAD_REQUEST,
         )
-
-    # check did discord id is exist in users table (please check by database)
-    # Please use app.state.services.database.fetch_val
-    user_info = await app.state.services.database.fetch_val(
-        "SELECT * FROM users WHERE discord_id = :discord_id",
-        {"discord_id": discord_id},
-    )
-    print(user_info)
-    if not user_info:
-        # 404 not found, response = "User not found!"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "User not found!"
-                },
-            },
-            status_code=status.HTTP_404_NOT_FOUND,
-        )
-    user_info = await players_repo.fetch_one(id=user_info)
-
-    if not user_info["priv"] & Privileges.STAFF:
-        # 403 forbidden, response = "You are not a Staff!"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "You are not a Staff!"
-                },
-            },
-            status_code=status.HTTP_403_FORBIDDEN,
-        )
-
-    if key != app.settings.OSU_API_KEY:
-        # Sucess = false, 403 forbidden, response = "Invalid osu!api key"
-        return ORJSONResponse(
-            {
-                "success": False,
-                "response": {
-                    "message": "Invalid osu!api key!"
-                },
-            },
-            status_code=status.HTTP_403_FORBIDDEN,
-        )
-    # Check did player is already whitelisted or not
-    # Please use app.state.services.database.fetch_val
-    # If status = 0, that mean player is not whitelisted
-    # If status = 1, that mean player is whitelisted
-    # We will whitelist only if status is 0
     target = await app.state.sessions.players.from_cache_or_sql(name=username)
     if not target:
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "Player not found!"
-                },
+                "response": {"message": "Player not found!"},
             },
             status_code=status.HTTP_404_NOT_FOUND,
         )
+    # Whitelist player; checking & setting the bit in one statement
+    # means concurrent requests can't both report success
+    rows_changed = await app.state.services.database.execute(
+        "UPDATE users SET priv = priv | :whitelisted "
+        "WHERE id = :user_id AND NOT priv & :whitelisted",
+        {"whitelisted": int(Privileges.WHITELISTED), "user_id": target.id},
+    )
     # If target player is already whitelisted, return error
-    if target.priv & Privileges.WHITELISTED:
+    if not rows_changed:
         return ORJSONResponse(
             {
                 "success": False,
-                "response": {
-                    "message": "Player is already whitelisted!"
-                },
+                "response": {"message": "Player is already whitelisted!"},
             },
             status_code=status.HTTP_403_FORBIDDEN,
         )
-    # Whitelist player
-    # Getting admin info
-    await target.add_privs(Privileges.WHITELISTED)
+    # sync the player object with sql
+    target.priv |= Privileges.WHITELISTED
+    if "bancho_priv" in target.__dict__:
+        del target.bancho_priv  # wipe cached_property
+    await app.state.services.redis.delete(f"bancho:players:{target.id}")
+    if target.is_online:
+        target.enqueue(app.packets.bancho_privileges(target.bancho_priv))
     # Return success
     return ORJSONResponse(
         {
             "success": True,
-            "response": {
-                "message": "Player has been whitelisted!"
-            },
+            "response": {"message": "Player has been whitelisted!"},
         },
         status_code=status.HTTP_200_OK,
     )
+
+
 # Give me example of api
 # /whitelist_player?discord_id=736163902835916880&username=Koi
 
+
 # Can you tell me, which api we add for serveal days? list please
-# /love_beatmap, /rank_beatmap, /cancel_beatmap, /restrict_player, /unrestrict_player, /whitelist_player   
+# /love_beatmap, /rank_beatmap, /cancel_beatmap, /restrict_player, /unrestrict_player, /whitelist_player
 @router.get("/get_player_status")
 async def api_get_player_status(
     user_id: int | None = Query(None, alias="id", ge=3, le=2_147_483_647),
-    username: str | None = Query(None, alias="name", pattern=regexes.USERNAME.pattern),
+    username: str | None = Query(None, alias="name", pattern=USERNAME_PATTERN),
 ) -> Response:
     """Return a players current status, if they are online."""
     if username and user_id:
-        return ORJSONResponse(
-            {"status": "Must provide either id OR name!"},
-            status_code=status.HTTP_400_BAD_REQUEST,
-        )
+        return status_response(ID_OR_NAME_REQUIRED, status.HTTP_400_BAD_REQUEST)
 
     if username:
         player = app.state.sessions.players.get(name=username)
     elif user_id:
         player = app.state.sessions.players.get(id=user_id)
     else:
-        return ORJSONResponse(
-            {"status": "Must provide either id OR name!"},
-            status_code=status.HTTP_400_BAD_REQUEST,
-        )
+        return status_response(ID_OR_NAME_REQUIRED, status.HTTP_400_BAD_REQUEST)
 
     if not player:
         # no such player online, return their last seen time if they exist in sql
-
         if username:
-            row = await players_repo.fetch_one(name=username)
-        else:  # if userid
-            row = await players_repo.fetch_one(id=user_id)
+            cache_key = f"bancho:player_status:name:{make_safe_name(username)}"
+        else:
+            cache_key = f"bancho:player_status:id:{user_id}"
 
-        if not row:
-            return ORJSONResponse(
-                {"status": "Player not found."},
-                status_code=status.HTTP_404_NOT_FOUND,
-            )
+        # an empty value means we already know the player doesn't exist
+        cached_last_seen = await app.state.services.redis.get(cache_key)
+        if cached_last_seen is not None:
+            last_seen = int(cached_last_seen) if cached_last_seen else None
+        else:
+            if username:
+                row = await players_repo.fetch_one(name=username)
+            else:  # if userid
+                row = await players_repo.fetch_one(id=user_id)
+
+            if row:
+                last_seen = row["latest_activity"]
+                await app.state.services.redis.set(
+                    cache_key,
+                    last_seen,
+                    ex=PLAYER_STATUS_CACHE_TTL,
+                )
+            else:
+                last_seen = None
+                await app.state.services.redis.set(
+                    cache_key,
+                    "",
+                    ex=PLAYER_NOT_FOUND_CACHE_TTL,
+                )
+
+        if last_seen is None:
+            return status_response(PLAYER_NOT_FOUND, status.HTTP_404_NOT_FOUND)
 
         return ORJSONResponse(
             {
                 "status": "success",
                 "player_status": {
                     "online": False,
-                    "last_seen": row["latest_activity"],
+                    "last_seen": last_seen,
                 },
             },
         )
 
+    player_status = (
+        player.login_time,
+        player.status.action,
+        player.status.info_text,
+        player.status.map_md5,
+        player.status.mods,
+        player.status.mode,
+    )
+
+    cached = online_player_status_responses.get(player)
+    if (
+        cached is not None
+        and cached[0] == player_status
+        and time.monotonic() < cached[1]
+    ):
+        return Response(content=cached[2], media_type="application/json")
+
     if player.status.map_md5:
         bmap = await Beatmap.from_md5(player.status.map_md5)
     else:
         bmap = None
 
-    return ORJSONResponse(
+    response = json_response(
         {
             "status": "success",
             "player_status": {
@@ -1624,12 +1708,20 @@ async def api_get_player_status(
         },
     )
 
+    online_player_status_responses[player] = (
+        player_status,
+        time.monotonic() + ONLINE_PLAYER_STATUS_CACHE_TTL,
+        response.body,
+    )
+
+    return response
+
 
 @router.get("/get_player_scores")
 async def api_get_player_scores(
     scope: Literal["recent", "best", "first"],
     user_id: int | None = Query(None, alias="id", ge=3, le=2_147_483_647),
-    username: str | None = Query(None, alias="name", pattern=regexes.USERNAME.pattern),
+    username: str | None = Query(None, alias="name", pattern=USERNAME_PATTERN),
     mods_arg: str | None = Query(None, alias="mods"),
     mode_arg: int = Query(0, alias="mode", ge=0, le=11),
     limit: int = Query(25, ge=1, le=100),
@@ -1643,32 +1735,20 @@ async def api_get_player_scores(
         GameMode.AUTOPILOT_TAIKO,
         GameMode.AUTOPILOT_MANIA,
     ):
-        return ORJSONResponse(
-            {"status": "Invalid gamemode."},
-            status_code=status.HTTP_400_BAD_REQUEST,
-        )
+        return status_response(INVALID_GAMEMODE, status.HTTP_400_BAD_REQUEST)
 
     if username and user_id:
-        return ORJSONResponse(
-            {"status": "Must provide either id OR name!"},
-            status_code=status.HTTP_400_BAD_REQUEST,
-        )
+        return status_response(ID_OR_NAME_REQUIRED, status.HTTP_400_BAD_REQUEST)
 
     if username:
         player = await app.state.sessions.players.from_cache_or_sql(name=username)
     elif user_id:
         player = await app.state.sessions.players.from_cache_or_sql(id=user_id)
     else:
-        return ORJSONResponse(
-            {"status": "Must provide either id OR name!"},
-            status_code=status.HTTP_400_BAD_REQUEST,
-        )
+        return status_response(ID_OR_NAME_REQUIRED, status.HTTP_400_BAD_REQUEST)
 
     if not player:
-        return ORJSONResponse(
-            {"status": "Player not found."},
-            status_code=status.HTTP_404_NOT_FOUND,
-        )
+        return status_response(PLAYER_NOT_FOUND, status.HTTP_404_NOT_FOUND)
 
     # parse args (scope, mode, mods, limit)
 
@@ -1691,14 +1771,7 @@ async def api_get_player_scores(
 
     # build sql query & fetch info
 
-    query = [
-        "SELECT t.id, t.map_md5, t.score, t.pp, t.acc, t.max_combo, "
-        "t.mods, t.n300, t.n100, t.n50, t.nmiss, t.ngeki, t.nkatu, t.grade, "
-        "t.status, t.mode, t.play_time, t.time_elapsed, t.perfect "
-        "FROM scores t "
-        "INNER JOIN maps b ON t.map_md5 = b.md5 "
-        "WHERE t.userid = :user_id AND t.mode = :mode",
-    ]
+    query = [PLAYER_SCORES_QUERY]
 
     params: dict[str, object] = {
         "user_id": player.id,
@@ -1727,34 +1800,31 @@ async def api_get_player_scores(
             query.append("AND t.status != 0")
 
         sort = "t.play_time"
-    else: # "first"
-        lb_sort = "score" if mode_arg <= 3 else "pp" # vanilla goes by score, relax and ap by pp
-        query = [
-            "SELECT t.id, t.map_md5, t.score, t.pp, t.acc, t.max_combo, "
-            "t.mods, t.n300, t.n100, t.n50, t.nmiss, t.ngeki, t.nkatu, t.grade, "
-            "t.status, t.mode, t.time_elapsed, t.play_time, t.perfect "
-            "FROM scores t "
-           f"JOIN (SELECT map_md5, MAX({lb_sort}) AS points FROM scores WHERE status = 2 GROUP BY map_md5) max_scores "
-           f"ON t.map_md5 = max_scores.map_md5 AND t.{lb_sort} = max_scores.points "
-            "INNER JOIN maps b ON max_scores.map_md5 = b.md5 "
-            "WHERE t.userid = :user_id AND t.mode = :mode AND t.status = 2 AND b.status IN (2, 3, 5)"
-        ]
+    else:  # "first"
+        # #1s are materialized by score submission (& a periodic refresh)
+        query = [PLAYER_FIRST_PLACES_QUERY]
         sort = "t.play_time"
 
     query.append(f"ORDER BY {sort} DESC LIMIT :limit")
     params["limit"] = limit
 
     rows = [
-        dict(row)
+        dict(row._mapping)
         for row in await app.state.services.database.fetch_all(" ".join(query), params)
     ]
 
+    # fetch & serialize each distinct beatmap once; recent
+    # scores will often have several plays on one map
+    map_md5s = list({row["map_md5"] for row in rows})
+    bmaps = await asyncio.gather(*(Beatmap.from_md5(md5) for md5 in map_md5s))
+    bmap_dicts = {
+        md5: bmap.as_dict if bmap else None for md5, bmap in zip(map_md5s, bmaps)
+    }
+
     # fetch & return info from sql
     for row in rows:
-        mods = Mods(row["mods"])
-        bmap = await Beatmap.from_md5(row.pop("map_md5"))
-        row["beatmap"] = bmap.as_dict if bmap else None
-        row["mods_readable"] = mods.__repr__()
+        row["beatmap"] = bmap_dicts[row.pop("map_md5")]
+        row["mods_readable"] = format_mods(row["mods"])
 
     player_info = {
         "id": player.id,
@@ -1780,61 +1850,51 @@ async def api_get_player_scores(
 @router.get("/get_player_most_played")
 async def api_get_player_most_played(
     user_id: int | None = Query(None, alias="id", ge=3, le=2_147_483_647),
-    username: str | None = Query(None, alias="name", pattern=regexes.USERNAME.pattern),
+    username: str | None = Query(None, alias="name", pattern=USERNAME_PATTERN),
     mode_arg: int = Query(0, alias="mode", ge=0, le=11),
     limit: int = Query(25, ge=1, le=100),
 ) -> Response:
     """Return the most played beatmaps of a given player."""
-    # NOTE: this will almost certainly not scale well, lol.
     if mode_arg in (
         GameMode.RELAX_MANIA,
         GameMode.AUTOPILOT_CATCH,
         GameMode.AUTOPILOT_TAIKO,
         GameMode.AUTOPILOT_MANIA,
     ):
-        return ORJSONResponse(
-            {"status": "Invalid gamemode."},
-            status_code=status.HTTP_400_BAD_REQUEST,
-        )
+        return status_response(INVALID_GAMEMODE, status.HTTP_400_BAD_REQUEST)
 
     if user_id is not None:
         player = await app.state.sessions.players.from_cache_or_sql(id=user_id)
     elif username is not None:
         player = await app.state.sessions.players.from_cache_or_sql(name=username)
     else:
-        return ORJSONResponse(
-            {"status": "Must provide either id or name."},
-            status_code=status.HTTP_400_BAD_REQUEST,
-        )
+        return status_response(POOL_ID_OR_NAME_REQUIRED, status.HTTP_400_BAD_REQUEST)
 
     if not player:
-        return ORJSONResponse(
-            {"status": "Player not found."},
-            status_code=status.HTTP_404_NOT_FOUND,
-        )
+        return status_response(PLAYER_NOT_FOUND, status.HTTP_404_NOT_FOUND)
 
     # parse args (mode, limit)
 
     mode = GameMode(mode_arg)
 
-    # fetch & return info from sql
+    # fetch & return info from sql; play counts
+    # are kept up to date by score submission
     rows = await app.state.services.database.fetch_all(
         "SELECT m.md5, m.id, m.set_id, m.status, "
-        "m.artist, m.title, m.version, m.creator, COUNT(*) plays "
-        "FROM scores s "
-        "INNER JOIN maps m ON m.md5 = s.map_md5 "
-        "WHERE s.userid = :user_id "
-        "AND s.mode = :mode "
-        "GROUP BY s.map_md5 "
-        "ORDER BY plays DESC "
+        "m.artist, m.title, m.version, m.creator, p.plays "
+        "FROM player_map_plays p "
+        "INNER JOIN maps m ON m.md5 = p.map_md5 "
+        "WHERE p.userid = :user_id "
+        "AND p.mode = :mode "
+        "ORDER BY p.plays DESC "
         "LIMIT :limit",
         {"user_id": player.id, "mode": mode, "limit": limit},
     )
 
-    return ORJSONResponse(
+    return json_response(
         {
             "status": "success",
-            "maps": [dict(row) for row in rows],
+            "maps": rows,
         },
     )
 
@@ -1850,16 +1910,10 @@ async def api_get_map_info(
     elif md5 is not None:
         bmap = await Beatmap.from_md5(md5)
     else:
-        return ORJSONResponse(
-            {"status": "Must provide either id or md5!"},
-            status_code=status.HTTP_400_BAD_REQUEST,
-        )
+        return status_response(ID_OR_MD5_REQUIRED, status.HTTP_400_BAD_REQUEST)
 
     if not bmap:
-        return ORJSONResponse(
-            {"status": "Map not found."},
-            status_code=status.HTTP_404_NOT_FOUND,
-        )
+        return status_response(MAP_NOT_FOUND, status.HTTP_404_NOT_FOUND)
 
     return ORJSONResponse(
         {
@@ -1885,26 +1939,17 @@ async def api_get_map_scores(
         GameMode.AUTOPILOT_TAIKO,
         GameMode.AUTOPILOT_MANIA,
     ):
-        return ORJSONResponse(
-            {"status": "Invalid gamemode."},
-            status_code=status.HTTP_400_BAD_REQUEST,
-        )
+        return status_response(INVALID_GAMEMODE, status.HTTP_400_BAD_REQUEST)
 
     if map_id is not None:
         bmap = await Beatmap.from_bid(map_id)
     elif map_md5 is not None:
         bmap = await Beatmap.from_md5(map_md5)
     else:
-        return ORJSONResponse(
-            {"status": "Must provide either id or md5!"},
-            status_code=status.HTTP_400_BAD_REQUEST,
-        )
+        return status_response(ID_OR_MD5_REQUIRED, status.HTTP_400_BAD_REQUEST)
 
     if not bmap:
-        return ORJSONResponse(
-            {"status": "Map not found."},
-            status_code=status.HTTP_404_NOT_FOUND,
-        )
+        return status_response(MAP_NOT_FOUND, status.HTTP_404_NOT_FOUND)
 
     # parse args (scope, mode, mods, limit)
 
@@ -1925,22 +1970,26 @@ async def api_get_map_scores(
     else:
         mods = None
 
+    # each map & mode's cached leaderboards share a hash,
+    # so a new score can invalidate all of them at once
+    if mods is not None:
+        mods_key = f"{'=' if strong_equality else '~'}{int(mods)}"
+    else:
+        mods_key = "any"
+
+    cache_key = f"bancho:map_scores:{bmap.md5}:{int(mode)}"
+    cache_field = f"{scope}:{mods_key}:{limit}"
+
+    cached_response = await cast(
+        Awaitable[bytes | None],
+        app.state.services.redis.hget(cache_key, cache_field),
+    )
+    if cached_response is not None:
+        return Response(content=cached_response, media_type="application/json")
+
     # NOTE: userid will eventually become player_id,
     # along with everywhere else in the codebase.
-    query = [
-        "SELECT s.map_md5, s.id, s.score, s.pp, s.acc, s.max_combo, s.mods, "
-        "s.n300, s.n100, s.n50, s.nmiss, s.ngeki, s.nkatu, s.grade, s.status, "
-        "s.mode, s.play_time, s.time_elapsed, s.userid, s.perfect, "
-        "u.name player_name, u.country, "
-        "c.id clan_id, c.name clan_name, c.tag clan_tag "
-        "FROM scores s "
-        "INNER JOIN users u ON u.id = s.userid "
-        "LEFT JOIN clans c ON c.id = u.clan_id "
-        "WHERE s.map_md5 = :map_md5 "
-        "AND s.mode = :mode "
-        "AND s.status = 2 "
-        "AND u.priv & 1",
-    ]
+    query = [MAP_SCORES_QUERY]
     params: dict[str, object] = {
         "map_md5": bmap.md5,
         "mode": mode,
@@ -1966,13 +2015,21 @@ async def api_get_map_scores(
 
     rows = await app.state.services.database.fetch_all(" ".join(query), params)
 
-    return ORJSONResponse(
+    response = json_response(
         {
             "status": "success",
-            "scores": [dict(row) for row in rows],
+            "scores": rows,
         },
     )
 
+    # NOTE: expire's nx option needs redis 7, which we don't require
+    pipe = app.state.services.redis.pipeline(transaction=False)
+    pipe.hset(cache_key, cache_field, response.body.decode())
+    pipe.expire(cache_key, MAP_SCORES_CACHE_TTL)
+    await pipe.execute()
+
+    return response
+
 
 @router.get("/get_score_info")
 async def api_get_score_info(
@@ -1982,10 +2039,7 @@ async def api_get_score_info(
     score = await scores_repo.fetch_one(score_id)
 
     if score is None:
-        return ORJSONResponse(
-            {"status": "Score not found."},
-            status_code=status.HTTP_404_NOT_FOUND,
-        )
+        return status_response(SCORE_NOT_FOUND, status.HTTP_404_NOT_FOUND)
 
     return ORJSONResponse({"status": "success", "score": score})
 
@@ -1998,18 +2052,15 @@ async def api_get_replay(
     include_headers: bool = True,
 ) -> Response:
     """Return a given replay (including headers)."""
-    # fetch replay file & make sure it exists
-    replay_file = REPLAYS_PATH / f"{score_id}.osr"
-    if not replay_file.exists():
-        return ORJSONResponse(
-            {"status": "Replay not found."},
-            status_code=status.HTTP_404_NOT_FOUND,
-        )
-    # read replay frames from file
-    raw_replay_data = replay_file.read_bytes()
+    # the replay frames are streamed from disk, if the file exists
+    replay_path = REPLAYS_PATH / f"{score_id}.osr"
+    try:
+        replay_size = replay_path.stat().st_size
+    except FileNotFoundError:
+        return status_response(REPLAY_NOT_FOUND, status.HTTP_404_NOT_FOUND)
     if not include_headers:
-        return Response(
-            bytes(raw_replay_data),
+        return FileResponse(
+            replay_path,
             media_type="application/octet-stream",
             headers={
                 "Content-Description": "File Transfer",
@@ -2032,28 +2083,20 @@ async def api_get_replay(
         {"score_id": score_id},
     )
     if not row:
-        # score not found in sql
-        return ORJSONResponse(
-            {"status": "Score not found."},
-            status_code=status.HTTP_404_NOT_FOUND,
-        )  # but replay was?
-    # generate the replay's hash
+        # score not found in sql (but replay was?)
+        return status_response(SCORE_NOT_FOUND, status.HTTP_404_NOT_FOUND)
+    # generate the replay's hash; the client verifies
+    # this against the replay, so it must remain md5.
+    n300_n100 = row["n100"] + row["n300"]
+    perfect = row["perfect"] == 1
+    rank = 0  # TODO: rank
     replay_md5 = hashlib.md5(
-        "{}p{}o{}o{}t{}a{}r{}e{}y{}o{}u{}{}{}".format(
-            row["n100"] + row["n300"],
-            row["n50"],
-            row["ngeki"],
-            row["nkatu"],
-            row["nmiss"],
-            row["map_md5"],
-            row["max_combo"],
-            str(row["perfect"] == 1),
-            row["username"],
-            row["score"],
-            0,  # TODO: rank
-            row["mods"],
-            "True",  # TODO: ??
+        (
+            f"{n300_n100}p{row['n50']}o{row['ngeki']}o{row['nkatu']}t"
+            f"{row['nmiss']}a{row['map_md5']}r{row['max_combo']}e{perfect}y"
+            f"{row['username']}o{row['score']}u{rank}{row['mods']}True"  # TODO: ??
         ).encode(),
+        usedforsecurity=False,
     ).hexdigest()
     # create a buffer to construct the replay output
     replay_data = bytearray()
@@ -2082,18 +2125,28 @@ async def api_get_replay(
     replay_data += b"\x00"  # TODO: hp graph
     timestamp = int(row["play_time"].timestamp() * 1e7)
     replay_data += struct.pack("<q", timestamp + DATETIME_OFFSET)
-    # pack the raw replay data into the buffer
-    replay_data += struct.pack("<i", len(raw_replay_data))
-    replay_data += raw_replay_data
+    # the raw replay data follows, streamed from disk
+    replay_data += struct.pack("<i", replay_size)
     # pack additional info buffer.
-    replay_data += struct.pack("<q", score_id)
+    replay_trailer = struct.pack("<q", score_id)
     # NOTE: target practice sends extra mods, but
     # can't submit scores so should not be a problem.
+
+    async def stream_replay() -> AsyncIterator[bytes]:
+        yield bytes(replay_data)
+        async with await anyio.open_file(replay_path, "rb") as replay_file:
+            while chunk := await replay_file.read(REPLAY_CHUNK_SIZE):
+                yield chunk
+        yield replay_trailer
+
+    content_length = len(replay_data) + replay_size + len(replay_trailer)
+
     # stream data back to the client
-    return Response(
-        bytes(replay_data),
+    return StreamingResponse(
+        stream_replay(),
         media_type="application/octet-stream",
         headers={
+            "Content-Length": str(content_length),
             "Content-Description": "File Transfer",
             "Content-Disposition": (
                 'attachment; filename="{username} - '
@@ -2113,10 +2166,7 @@ async def api_get_match(
 
     match = app.state.sessions.matches[match_id]
     if not match:
-        return ORJSONResponse(
-            {"status": "Match not found."},
-            status_code=status.HTTP_404_NOT_FOUND,
-        )
+        return status_response(MATCH_NOT_FOUND, status.HTTP_404_NOT_FOUND)
 
     return ORJSONResponse(
         {
@@ -2168,37 +2218,56 @@ async def api_get_global_leaderboard(
         GameMode.AUTOPILOT_TAIKO,
         GameMode.AUTOPILOT_MANIA,
     ):
-        return ORJSONResponse(
-            {"status": "Invalid gamemode."},
-            status_code=status.HTTP_400_BAD_REQUEST,
-        )
+        return status_response(INVALID_GAMEMODE, status.HTTP_400_BAD_REQUEST)
 
     mode = GameMode(mode_arg)
 
-    query_conditions = ["s.mode = :mode", "u.priv & 1", f"s.{sort} > 0"]
-    query_parameters: dict[str, object] = {"mode": mode}
+    cache_key = (
+        f"bancho:leaderboard_pages:{int(mode)}:{sort}:{country}:{offset}:{limit}"
+    )
 
-    if country is not None:
-        query_conditions.append("u.country = :country")
-        query_parameters["country"] = country
+    cached_response = await app.state.services.redis.get(cache_key)
+    if cached_response is not None:
+        return Response(content=cached_response, media_type="application/json")
 
-    rows = await app.state.services.database.fetch_all(
-        "SELECT u.id as player_id, u.name, u.country, s.tscore, s.rscore, "
-        "s.pp, s.plays, s.playtime, s.acc, s.max_combo, "
-        "s.xh_count, s.x_count, s.sh_count, s.s_count, s.a_count, "
-        "c.id as clan_id, c.name as clan_name, c.tag as clan_tag "
-        "FROM stats s "
-        "LEFT JOIN users u USING (id) "
-        "LEFT JOIN clans c ON u.clan_id = c.id "
-        f"WHERE {' AND '.join(query_conditions)} "
-        f"ORDER BY s.{sort} DESC LIMIT :offset, :limit",
-        query_parameters | {"offset": offset, "limit": limit},
-    )
+    if sort == "pp" and offset >= LEADERBOARD_MAX_SQL_OFFSET:
+        rows = await fetch_ranked_leaderboard_page(mode, country, offset, limit)
+    else:
+        query_conditions = ["s.mode = :mode", "u.priv & 1", f"s.{sort} > 0"]
+        query_parameters: dict[str, object] = {"mode": mode}
 
-    return ORJSONResponse(
-        {"status": "success", "leaderboard": [dict(row) for row in rows]},
+        if country is not None:
+            query_conditions.append("u.country = :country")
+            query_parameters["country"] = country
+
+        rows = await app.state.services.database.fetch_all(
+            f"{LEADERBOARD_QUERY} "
+            f"WHERE {' AND '.join(query_conditions)} "
+            f"ORDER BY s.{sort} DESC LIMIT :offset, :limit",
+            query_parameters | {"offset": offset, "limit": limit},
+        )
+
+    # every clan is held in memory, so there's no need to join them
+    clans = {clan.id: clan for clan in app.state.sessions.clans}
+
+    leaderboard = []
+    for row in rows:
+        entry = dict(row._mapping)
+        clan = clans.get(entry.pop("clan_id"))
+        entry["clan_id"] = clan.id if clan else None
+        entry["clan_name"] = clan.name if clan else None
+        entry["clan_tag"] = clan.tag if clan else None
+        leaderboard.append(entry)
+
+    response = json_response({"status": "success", "leaderboard": leaderboard})
+    await app.state.services.redis.set(
+        cache_key,
+        response.body,
+        ex=LEADERBOARD_CACHE_TTL,
     )
 
+    return response
+
 
 @router.get("/get_clan")
 async def api_get_clan(
@@ -2210,22 +2279,36 @@ async def api_get_clan(
 
     clan = app.state.sessions.clans.get(id=clan_id)
     if not clan:
-        return ORJSONResponse(
-            {"status": "Clan not found."},
-            status_code=status.HTTP_404_NOT_FOUND,
-        )
+        return status_response(CLAN_NOT_FOUND, status.HTTP_404_NOT_FOUND)
+
+    cache_key = f"bancho:clans:{clan.id}"
 
+    cached_response = await app.state.services.redis.get(cache_key)
+    if cached_response is not None:
+        return Response(content=cached_response, media_type="application/json")
+
+    # fetch all of the clan's members concurrently
     members: list[Player] = []
 
-    for member_id in clan.member_ids:
-        member = await app.state.sessions.players.from_cache_or_sql(id=member_id)
+    for member in await asyncio.gather(
+        *(
+            app.state.sessions.players.from_cache_or_sql(id=member_id)
+            for member_id in clan.member_ids
+        ),
+    ):
         assert member is not None
         members.append(member)
 
-    owner = await app.state.sessions.players.from_cache_or_sql(id=clan.owner_id)
-    assert owner is not None
+    # the owner is (almost) always among the members
+    for member in members:
+        if member.id == clan.owner_id:
+            owner = member
+            break
+    else:
+        owner = await app.state.sessions.players.from_cache_or_sql(id=clan.owner_id)
+        assert owner is not None
 
-    return ORJSONResponse(
+    response = json_response(
         {
             "id": clan.id,
             "name": clan.name,
@@ -2247,6 +2330,9 @@ async def api_get_clan(
             },
         },
     )
+    await app.state.services.redis.set(cache_key, response.body, ex=CLAN_CACHE_TTL)
+
+    return response
 
 
 @router.get("/get_mappool")
@@ -2259,10 +2345,7 @@ async def api_get_pool(
 
     pool = app.state.sessions.pools.get(id=pool_id)
     if not pool:
-        return ORJSONResponse(
-            {"status": "Pool not found."},
-            status_code=status.HTTP_404_NOT_FOUND,
-        )
+        return status_response(POOL_NOT_FOUND, status.HTTP_404_NOT_FOUND)
 
     return ORJSONResponse(
         {
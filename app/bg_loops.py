@@ -2,20 +2,75 @@ from __future__ import annotations
 
 import asyncio
 import time
+from collections.abc import Awaitable
+from collections.abc import Callable
+from datetime import datetime
+from datetime import timezone
+
+from databases.interfaces import Record
 
 import app.packets
 import app.settings
 import app.state
 from app.constants.privileges import Privileges
+from app.discord import Webhook
 from app.logging import Ansi
 from app.logging import log
-from datetime import datetime, timedelta
-from app.discord import Webhook, Embed
+from app.objects.beatmap import RankedStatus
+from app.repositories import first_places as first_places_repo
+from app.usecases.beatmap_status import make_status_embed
+from app.usecases.beatmap_status import STATUS_CHANGE_COLOURS
+from app.usecases.beatmap_status import STATUS_CHANGE_DESCRIPTION
 
-__all__ = ("initialize_housekeeping_tasks",)
+__all__ = ("initialize_housekeeping_tasks", "notify_set_qualified")
 
 OSU_CLIENT_MIN_PING_INTERVAL = 300000 // 1000  # defined by osu!
 
+# how long a set stays qualified before it's ranked
+QUALIFIED_MAPS_RANK_DELAY_MINUTES = 1440
+
+# the longest we'll go without checking for qualified sets, to
+# pick up any qualified without notifying us (e.g. by hand in the db)
+QUALIFIED_MAPS_RESYNC_INTERVAL = 60 * 60
+
+# how long to wait before checking again after a failed check
+QUALIFIED_MAPS_RETRY_INTERVAL = 60
+
+# set whenever a set is qualified, waking the ranking task up early
+_set_qualified = asyncio.Event()
+
+# sql for the housekeeping tasks, built once at import time
+EXPIRED_DONORS_QUERY = (
+    "SELECT id, name FROM users "
+    "WHERE donor_end <= UNIX_TIMESTAMP() "
+    "AND priv & :donor_priv "
+    "FOR UPDATE"
+)
+REVOKE_DONOR_PRIVS_QUERY = (
+    "UPDATE users SET priv = priv & ~:donor_privs, donor_end = 0 "
+    "WHERE id IN :user_ids"
+)
+# change_date is set with now(), so compare against the
+# db's clock rather than the (possibly differently zoned) app's.
+# only a set's qualified difficulties are ranked; others keep their status
+QUALIFIED_MAPS_QUERY = (
+    "SELECT set_id, id, md5, artist, title, creator FROM maps "
+    "WHERE status = 4 AND set_id IN ("
+    "SELECT set_id FROM maps "
+    "WHERE status = 4 "
+    "AND change_date < NOW() - INTERVAL :qualified_minutes MINUTE"
+    ") FOR UPDATE"
+)
+RANK_QUALIFIED_MAPS_QUERY = "UPDATE maps SET status = 2 WHERE id IN :map_ids"
+DELETE_MAP_REQUESTS_QUERY = "DELETE FROM map_requests WHERE map_id IN :map_ids"
+DELETE_MAP_SCORES_QUERY = "DELETE FROM scores WHERE map_md5 IN :map_md5s"
+# NULL when nothing is qualified
+NEXT_QUALIFIED_SET_DUE_QUERY = (
+    "SELECT TIMESTAMPDIFF(SECOND, NOW(), "
+    "MIN(change_date) + INTERVAL :qualified_minutes MINUTE) "
+    "FROM maps WHERE status = 4"
+)
+
 
 async def initialize_housekeeping_tasks() -> None:
     """Create tasks for each housekeeping tasks."""
@@ -27,161 +82,274 @@ async def initialize_housekeeping_tasks() -> None:
         {
             loop.create_task(task)
             for task in (
-                _remove_expired_donation_privileges(interval=30 * 60),
-                _update_bot_status(interval=5 * 60),
-                _disconnect_ghosts(interval=OSU_CLIENT_MIN_PING_INTERVAL // 3),
-                _check_betmap_status(interval=60),
+                _run_periodically(
+                    _remove_expired_donation_privileges,
+                    interval=30 * 60,
+                    run_immediately=True,
+                ),
+                _run_periodically(
+                    _disconnect_ghosts,
+                    interval=OSU_CLIENT_MIN_PING_INTERVAL // 3,
+                ),
+                _rank_qualified_sets(),
+                _run_periodically(_refresh_first_places, interval=60 * 60),
             )
         },
     )
 
 
-async def _remove_expired_donation_privileges(interval: int) -> None:
-    """Remove donation privileges from users with expired sessions."""
+def _next_deadline(deadline: float, interval: float, now: float) -> float:
+    """Find the first deadline on `interval`'s schedule which is after `now`."""
+    deadline += interval
+    if deadline <= now:
+        # the last run overran; skip the runs we missed, rather than
+        # running back to back to catch up with the schedule.
+        deadline += ((now - deadline) // interval + 1) * interval
+    return deadline
+
+
+async def _run_periodically(
+    task: Callable[[], Awaitable[None]],
+    interval: float,
+    run_immediately: bool = False,
+) -> None:
+    """Run `task` at a fixed rate of once every `interval` seconds.
+
+    Deadlines are kept relative to when the schedule began, so the
+    time spent running `task` doesn't push back every later run."""
+    loop = asyncio.get_running_loop()
+
+    deadline = loop.time()
+    if not run_immediately:
+        deadline += interval
+
+    while True:
+        await asyncio.sleep(max(0.0, deadline - loop.time()))
+        try:
+            await task()
+        except Exception as exc:
+            # one failed run shouldn't stop the task for good
+            _report_task_exception(task.__name__, exc)
+        deadline = _next_deadline(deadline, interval, loop.time())
+
+
+def _report_task_exception(task_name: str, exc: Exception) -> None:
+    """Report an exception raised by a housekeeping task, which keeps running."""
+    asyncio.get_running_loop().call_exception_handler(
+        {
+            "message": f"unhandled exception in housekeeping task {task_name}",
+            "exception": exc,
+        },
+    )
+
+
+def notify_set_qualified() -> None:
+    """Let the ranking task know a set was qualified, so it can be scheduled."""
+    _set_qualified.set()
+
+
+def _qualified_sets_wait_timeout(seconds_until_due: int | None) -> float:
+    """Find how long to sleep for, given when the next qualified set is due."""
+    if seconds_until_due is None:
+        # nothing's qualified; wait to be notified
+        return QUALIFIED_MAPS_RESYNC_INTERVAL
+
+    # the db's clock only has second precision, so
+    # wait an extra second to be sure the set is due
+    return min(max(seconds_until_due, 0) + 1, QUALIFIED_MAPS_RESYNC_INTERVAL)
+
+
+async def _rank_qualified_sets() -> None:
+    """Rank qualified sets as they come due.
+
+    Rather than polling, sleep until the next qualified set is due,
+    waking up early whenever another set is qualified."""
     while True:
-        if app.settings.DEBUG:
-            log("Removing expired donation privileges.", Ansi.LMAGENTA)
+        # clear before checking, so a set qualified
+        # during the check will still wake us up
+        _set_qualified.clear()
 
+        try:
+            await _check_betmap_status()
+
+            seconds_until_due = await app.state.services.database.fetch_val(
+                NEXT_QUALIFIED_SET_DUE_QUERY,
+                {"qualified_minutes": QUALIFIED_MAPS_RANK_DELAY_MINUTES},
+            )
+        except Exception as exc:
+            # one failed check shouldn't stop the task for good
+            _report_task_exception("_rank_qualified_sets", exc)
+            timeout: float = QUALIFIED_MAPS_RETRY_INTERVAL
+        else:
+            timeout = _qualified_sets_wait_timeout(seconds_until_due)
+
+        try:
+            await asyncio.wait_for(_set_qualified.wait(), timeout=timeout)
+        except TimeoutError:
+            pass
+
+
+async def _remove_expired_donation_privileges() -> None:
+    """Remove donation privileges from users with expired sessions."""
+    if app.settings.DEBUG:
+        log("Removing expired donation privileges.", Ansi.LMAGENTA)
+
+    donor_privs = Privileges.DONATOR | Privileges.VOTER
+
+    # lock the expired donors' rows so a renewal can't
+    # slip in between finding them & revoking their privs
+    async with app.state.services.database.transaction():
         expired_donors = await app.state.services.database.fetch_all(
-            "SELECT id FROM users "
-            "WHERE donor_end <= UNIX_TIMESTAMP() "
-            "AND priv & :donor_priv",
+            EXPIRED_DONORS_QUERY,
             {"donor_priv": Privileges.DONATOR.value},
         )
+        if not expired_donors:
+            return
 
-        for expired_donor in expired_donors:
-            player = await app.state.sessions.players.from_cache_or_sql(
-                id=expired_donor["id"],
-            )
+        # revoke everyone's supporter privileges in a single statement
+        expired_donor_ids = [expired_donor["id"] for expired_donor in expired_donors]
 
-            assert player is not None
+        await app.state.services.database.execute(
+            REVOKE_DONOR_PRIVS_QUERY,
+            {"donor_privs": donor_privs.value, "user_ids": expired_donor_ids},
+        )
+
+    # drop the api's cached copies of their rows
+    await app.state.services.redis.delete(
+        *(f"bancho:players:{user_id}" for user_id in expired_donor_ids),
+    )
 
+    for expired_donor in expired_donors:
+        # only online players' in-memory state needs syncing
+        player = app.state.sessions.players.get(id=expired_donor["id"])
+
+        if player is not None:
             # TODO: perhaps make a `revoke_donor` method?
-            await player.remove_privs(Privileges.DONATOR)
-            await player.remove_privs(Privileges.VOTER)
+            player.priv &= ~donor_privs
             player.donor_end = 0
-            await app.state.services.database.execute(
-                "UPDATE users SET donor_end = 0 WHERE id = :id",
-                {"id": player.id},
-            )
 
-            if player.is_online:
-                player.enqueue(
-                    app.packets.notification("Your supporter status has expired."),
-                )
+            if "bancho_priv" in player.__dict__:
+                del player.bancho_priv  # wipe cached_property
 
-            log(f"{player}'s supporter status has expired.", Ansi.LMAGENTA)
+            player.enqueue(app.packets.bancho_privileges(player.bancho_priv))
+            player.enqueue(
+                app.packets.notification("Your supporter status has expired."),
+            )
 
-        await asyncio.sleep(interval)
+        log(f"{expired_donor['name']}'s supporter status has expired.", Ansi.LMAGENTA)
 
 
-async def _disconnect_ghosts(interval: int) -> None:
+async def _disconnect_ghosts() -> None:
     """Actively disconnect users above the
     disconnection time threshold on the osu! server."""
-    while True:
-        await asyncio.sleep(interval)
-        current_time = time.time()
+    cutoff = time.time() - OSU_CLIENT_MIN_PING_INTERVAL
 
-        for player in app.state.sessions.players:
-            if current_time - player.last_recv_time > OSU_CLIENT_MIN_PING_INTERVAL:
-                log(f"Auto-dced {player}.", Ansi.LMAGENTA)
-                player.logout()
+    # logging out removes the player from the collection
+    for player in tuple(app.state.sessions.players):
+        if player.last_recv_time < cutoff:
+            log(f"Auto-dced {player}.", Ansi.LMAGENTA)
+            player.logout()
 
 
-async def _update_bot_status(interval: int) -> None:
-    """Re roll the bot status, every `interval`."""
-    while True:
-        await asyncio.sleep(interval)
-        app.packets.bot_stats.cache_clear()
-        
-# if any qualified beatmap change_date is than 1 minute, beatmap should to be ranked
-import asyncio
-from datetime import datetime, timedelta
+async def _refresh_first_places() -> None:
+    """Recompute the materialized #1 scores."""
+    if app.settings.DEBUG:
+        log("Refreshing first places.", Ansi.LMAGENTA)
 
-async def _check_betmap_status(interval: int) -> None:
-    while True:
-        print("Checking beatmap status.")
-        await asyncio.sleep(interval)
-
-        # Calculate the threshold time for ranked beatmaps but one day ago
-        one_day_ago = datetime.now() - timedelta(minutes=1440)
-        # make to unix timestamp
-        one_day_ago = one_day_ago.timestamp()
-        # Use parameterized query for security and efficiency
-        qualified_beatmaps = await app.state.services.database.fetch_all(
-            "SELECT set_id FROM maps WHERE status = 4 AND change_date < :threshold_time",
-            {"threshold_time": datetime.fromtimestamp(one_day_ago)}
+    await first_places_repo.refresh_all()
+
+
+# if any qualified beatmap change_date is older than a day, beatmap should to be ranked
+async def _check_betmap_status() -> None:
+    if app.settings.DEBUG:
+        log("Checking beatmap status.", Ansi.LMAGENTA)
+
+    # mysql has no UPDATE ... RETURNING, so lock every map of the qualified
+    # sets while reading all we need, then rank them in the same transaction.
+    async with app.state.services.database.transaction():
+        qualified_maps = await app.state.services.database.fetch_all(
+            QUALIFIED_MAPS_QUERY,
+            {"qualified_minutes": QUALIFIED_MAPS_RANK_DELAY_MINUTES},
         )
-        alreadyrank = []
-
-        for beatmap_id in qualified_beatmaps:
-            # Extract id directly for efficiency
-            id = beatmap_id["set_id"]
-            await app.state.services.database.execute(
-                "UPDATE maps SET status = 2 WHERE set_id = :id",
-                {"id": id}
-            )
-            bmap_artist = await app.state.services.database.fetch_val(
-                "SELECT artist FROM maps WHERE set_id = :id",
-                {"id": id}
-            )
-            bmap_title = await app.state.services.database.fetch_val(
-                "SELECT title FROM maps WHERE set_id = :id",
-                {"id": id}
-            )
-            bmap_creator = await app.state.services.database.fetch_val(
-                "SELECT creator FROM maps WHERE set_id = :id",
-                {"id": id}
-            )
-            bmap_version = await app.state.services.database.fetch_val(
-                "SELECT version FROM maps WHERE set_id = :id",
-                {"id": id}
-            )
-            
-            # Remove change_date from maps
-            #await app.state.services.database.execute(
-            #    "UPDATE maps SET change_date = NULL WHERE set_id = :id",
-            #    {"id": beatmap_id}
-            #)
-            # Generate new webhook, with url to beatmap
-            if id not in alreadyrank:
-                alreadyrank.append(id)
-                if webhook_url := app.settings.DISCORD_NOMINATION_WEBHOOK:
-                    embed = Embed(title="", description=f"[{bmap_artist} - {bmap_title} ({bmap_creator})](https://osu.ppy.sh/beatmapsets/{id}) is now ranked!", timestamp=datetime.utcnow(), color=52478)
-                    embed.set_author(name="Automatic Status Bot (Click to get beatmap!)", icon_url="https://a.ppy.sh/1", url=f"https://osu.ppy.sh/beatmapsets/{id}")
-                    embed.set_image(url=f"https://assets.ppy.sh/beatmaps/{id}/covers/card.jpg")
-                    embed.set_footer(text="Nomination Tools")
-                    webhook = Webhook(webhook_url, embeds=[embed])
-                    await webhook.post()
-            
-            
-            # Getting beatmap id by set_id
-            map_ids = await app.state.services.database.fetch_all(
-                "SELECT id FROM maps WHERE set_id = :id",
-                {"id": id}
-            )
-            for map_id in map_ids:
-                # make sure db is updated
-                # like this
-                # for _bmap in app.state.cache.beatmapset[bmap.set_id].maps:
-                #                _bmap.status = new_status
-                #                _bmap.frozen = True
-                md5 = await app.state.services.database.fetch_val(
-                    "SELECT md5 FROM maps WHERE id = :id",
-                    {"id": map_id}
-                )
-                if md5 in app.state.cache.beatmap:
-                    app.state.cache.beatmap[md5].status = 2
-                    app.state.cache.beatmap[md5].frozen = True
-                # delete request from map_requests (map_id)
-                await app.state.services.database.execute(
-                    "DELETE FROM map_requests WHERE map_id = :id",
-                    {"id": map_id}
-                )
-                # Delete all scores for this beatmap
-                await app.state.services.database.execute(
-                    "DELETE FROM scores WHERE map_md5 = :map_md5",
-                    {"map_md5": md5}
-                )
-                log(f"Beatmap {id} has been ranked.", Ansi.LMAGENTA)
+        if not qualified_maps:
+            return
+
+        qualified_mapsets: dict[int, list[Record]] = {}
+        for map_row in qualified_maps:
+            qualified_mapsets.setdefault(map_row["set_id"], []).append(map_row)
+
+        # rank every qualified map at once
+        qualified_map_ids = [map_row["id"] for map_row in qualified_maps]
+        await app.state.services.database.execute(
+            RANK_QUALIFIED_MAPS_QUERY,
+            {"map_ids": qualified_map_ids},
+        )
+
+        # Remove change_date from maps
+        # await app.state.services.database.execute(
+        #    "UPDATE maps SET change_date = NULL WHERE set_id = :id",
+        #    {"id": beatmap_id}
+        # )
+
+        # delete the sets' requests from map_requests
+        await app.state.services.database.execute(
+            DELETE_MAP_REQUESTS_QUERY,
+            {"map_ids": qualified_map_ids},
+        )
+        # Delete all scores for the sets' beatmaps
+        await app.state.services.database.execute(
+            DELETE_MAP_SCORES_QUERY,
+            {"map_md5s": [map_row["md5"] for map_row in qualified_maps]},
+        )
+
+    # sync the cache with the db in one pass over the whole tick
+    beatmap_cache = app.state.cache.beatmap
+    for map_row in qualified_maps:
+        cached_bmap = beatmap_cache.get(map_row["md5"])
+        if cached_bmap is not None:
+            cached_bmap.status = RankedStatus.Ranked
+            cached_bmap.frozen = True
+
+    # announcements are posted together once the tick's db work is done
+    webhooks: list[Webhook] = []
+    for set_id, maps in qualified_mapsets.items():
+        log(f"Beatmap set {set_id} ({len(maps)} maps) has been ranked.", Ansi.LMAGENTA)
+
+        webhook = _make_ranked_set_webhook(set_id, maps)
+        if webhook is not None:
+            webhooks.append(webhook)
+
+    # a failed post shouldn't take the housekeeping task down with it
+    results = await asyncio.gather(
+        *(webhook.post() for webhook in webhooks),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            log(f"Failed to post ranked beatmap webhook: {result}", Ansi.LRED)
+
+
+def _make_ranked_set_webhook(id: int, maps: list[Record]) -> Webhook | None:
+    """Create the announcement for a newly ranked set (if any)."""
+    bmap_artist = maps[0]["artist"]
+    bmap_title = maps[0]["title"]
+    bmap_creator = maps[0]["creator"]
+
+    # Generate new webhook, with url to beatmap
+    if webhook_url := app.settings.DISCORD_NOMINATION_WEBHOOK:
+        description = STATUS_CHANGE_DESCRIPTION.format(
+            artist=bmap_artist,
+            title=bmap_title,
+            creator=bmap_creator,
+            set_id=id,
+            status="ranked",
+        )
+        embed = make_status_embed(
+            description,
+            id,
+            colour=STATUS_CHANGE_COLOURS["ranked"],
+            timestamp=datetime.now(timezone.utc),
+        )
+        return Webhook(webhook_url, embeds=[embed])
 
+    return None
@@ -33,6 +33,7 @@ import psutil
 import timeago
 from pytimeparse.timeparse import timeparse
 
+import app.bg_loops
 import app.logging
 import app.packets
 import app.settings
@@ -741,7 +742,7 @@ async def _map(ctx: Context) -> str | None:
                         for _bmap in bmap.set.maps:
                             await maps_repo.update(_bmap.id, status=new_status, frozen=True)
                             # make sure cache and db are synced about the newest change
-                        for _bmap in app.state.cache.beatmapset[bmap.set_id].maps:
+                        for _bmap in bmap.set.maps:
                             _bmap.status = new_status
                             _bmap.frozen = True
                         # select all map ids for clearing map requests.
@@ -756,6 +757,8 @@ async def _map(ctx: Context) -> str | None:
                             "UPDATE maps SET change_date = now() WHERE set_id = :set_id",
                             {"set_id": bmap.set_id}
                         )
+                        if new_status == RankedStatus.Qualified:
+                            app.bg_loops.notify_set_qualified()
                         if new_status == RankedStatus.Ranked:
                             await db_conn.execute(
                                 "DELETE FROM scores WHERE map_md5 IN :map_md5s",
@@ -837,7 +840,7 @@ async def _map(ctx: Context) -> str | None:
                 for _bmap in bmap.set.maps:
                     await maps_repo.update(_bmap.id, status=new_status, frozen=True)
                     # make sure cache and db are synced about the newest change
-                for _bmap in app.state.cache.beatmapset[bmap.set_id].maps:
+                for _bmap in bmap.set.maps:
                     _bmap.status = new_status
                     _bmap.frozen = True
                 # select all map ids for clearing map requests.
@@ -930,12 +933,10 @@ async def _map(ctx: Context) -> str | None:
 
         # Check if the list is empty
         if vote_keys_list:
-            print(vote_keys_list)
             return "You have already voted for this set."
 
         # Get the vote count from Redis
         vote_count = len(vote_maps_list)
-        print(vote_count)
         if vote_count is None:
             await app.state.services.redis.set(vote_key, 1)
             vote_count = '1'
@@ -944,7 +945,6 @@ async def _map(ctx: Context) -> str | None:
             vote_count = str(vote_count + 1)
         else:
             return "Error: vote count is not an integer."
-        print(vote_count)
         if int(vote_count) == 2:
         # if vote number is 2, use code in below
             async with app.state.services.database.connection() as db_conn:
@@ -958,9 +958,11 @@ async def _map(ctx: Context) -> str | None:
                     for _bmap in bmap.set.maps:
                         await maps_repo.update(_bmap.id, status=new_status, frozen=True)
                         # make sure cache and db are synced about the newest change
-                    for _bmap in app.state.cache.beatmapset[bmap.set_id].maps:
+                    for _bmap in bmap.set.maps:
                         _bmap.status = new_status
                         _bmap.frozen = True
+                    if new_status == RankedStatus.Qualified:
+                        app.bg_loops.notify_set_qualified()
                     # select all map ids for clearing map requests.
                     map_ids = [
                         row["id"]
@@ -1098,7 +1100,6 @@ async def wipeuser(ctx: Context) -> str | None:
     if not target:
         return f'"{ctx.args[0]}" not found.'
 
-    print(target.id)
     await app.state.services.database.execute(
         "DELETE FROM scores WHERE userid = :id",
         {"id": target.id}
@@ -1880,7 +1881,6 @@ async def changecountry(ctx: Context) -> str | None:
             f'bancho:leaderboard:{mode.value}:{cc}',
             {str(target.id): stats.pp}
         )
-        print(f"UPDATED {mode} {target.geoloc['country']['acronym']} -> {cc} with PP {stats.pp}")
 
     return f"Updated {target.embed}'s country to {cc.upper()}."
 
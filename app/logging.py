@@ -77,6 +77,10 @@ def set_timezone(tz: ZoneInfo) -> None:
     _log_tz = tz
 
 
+def get_timezone() -> ZoneInfo:
+    return _log_tz
+
+
 def printc(msg: str, col: Colour_Types, end: str = "\n") -> None:
     """Print a string, in a specified ansi colour."""
     print(f"{col!r}{msg}{Ansi.RESET!r}", end=end)
@@ -139,13 +143,16 @@ def print_rainbow(msg: str, rainbow_end: float = 2 / 3, end: str = "\n") -> None
 
 # TODO: support all named orders of magnitude?
 # https://en.wikipedia.org/wiki/Metric_prefix
-TIME_ORDER_SUFFIXES = ["nsec", "μsec", "msec", "sec"]
+TIME_ORDER_MAGNITUDES = (
+    (1_000_000_000, "sec"),
+    (1_000_000, "msec"),
+    (1_000, "μsec"),
+)
 
 
 def magnitude_fmt_time(t: int | float) -> str:  # in nanosec
-    suffix = None
-    for suffix in TIME_ORDER_SUFFIXES:
-        if t < 1000:
-            break
-        t /= 1000
-    return f"{t:.2f} {suffix}"
+    for divisor, suffix in TIME_ORDER_MAGNITUDES:
+        if t >= divisor:
+            return f"{t / divisor:.2f} {suffix}"
+
+    return f"{t:.2f} nsec"
@@ -29,7 +29,13 @@ from app.utils import pymysql_encode
 
 # from dataclasses import dataclass
 
-__all__ = ("ensure_local_osu_file", "RankedStatus", "Beatmap", "BeatmapSet")
+__all__ = (
+    "fetch_local_osu_file",
+    "ensure_local_osu_file",
+    "RankedStatus",
+    "Beatmap",
+    "BeatmapSet",
+)
 
 BEATMAPS_PATH = Path.cwd() / ".data/osu"
 
@@ -37,6 +43,10 @@ DEFAULT_LAST_UPDATE = datetime(1970, 1, 1)
 
 IGNORED_BEATMAP_CHARS = dict.fromkeys(map(ord, r':\/*<>?"|'), None)
 
+# how long lookups of maps which exist in neither
+# the database nor the osu!api are remembered for
+MISSING_BEATMAP_CACHE_TTL = 60  # seconds
+
 
 class BeatmapApiResponse(TypedDict):
     data: list[dict[str, Any]] | None
@@ -69,6 +79,41 @@ async def api_get_beatmaps(**params: Any) -> BeatmapApiResponse:
     return {"data": None, "status_code": response.status_code}
 
 
+async def _download_osu_file(osu_file_path: Path, bmap_id: int) -> bytes | None:
+    """Download a .osu file from the osu!api, saving it to `osu_file_path`."""
+    if app.settings.DEBUG:
+        log(f"Doing osu!api (.osu file) request {bmap_id}", Ansi.LMAGENTA)
+
+    url = f"https://old.ppy.sh/osu/{bmap_id}"
+    response = await app.state.services.http_client.get(url)
+    if response.status_code != 200:
+        if 400 <= response.status_code < 500:
+            # client error, report this to cmyui
+            stacktrace = app.utils.get_appropriate_stacktrace()
+            await app.state.services.log_strange_occurrence(stacktrace)
+        return None
+
+    osu_file = response.read()
+    osu_file_path.write_bytes(osu_file)
+    return osu_file
+
+
+async def fetch_local_osu_file(
+    osu_file_path: Path,
+    bmap_id: int,
+    bmap_md5: str,
+) -> bytes | None:
+    """Return the contents of the latest .osu file, downloading
+    it from the osu!api if our local copy is missing or outdated."""
+    if osu_file_path.exists():
+        osu_file = osu_file_path.read_bytes()
+        if hashlib.md5(osu_file).hexdigest() == bmap_md5:
+            return osu_file
+
+    # need to get the file from the osu!api
+    return await _download_osu_file(osu_file_path, bmap_id)
+
+
 async def ensure_local_osu_file(
     osu_file_path: Path,
     bmap_id: int,
@@ -76,26 +121,14 @@ async def ensure_local_osu_file(
 ) -> bool:
     """Ensure we have the latest .osu file locally,
     downloading it from the osu!api if required."""
-    if (
-        not osu_file_path.exists()
-        or hashlib.md5(osu_file_path.read_bytes()).hexdigest() != bmap_md5
-    ):
-        # need to get the file from the osu!api
-        if app.settings.DEBUG:
-            log(f"Doing osu!api (.osu file) request {bmap_id}", Ansi.LMAGENTA)
+    if osu_file_path.exists():
+        # the contents aren't needed here, so stream them through the hash
+        with osu_file_path.open("rb") as f:
+            if hashlib.file_digest(f, "md5").hexdigest() == bmap_md5:
+                return True
 
-        url = f"https://old.ppy.sh/osu/{bmap_id}"
-        response = await app.state.services.http_client.get(url)
-        if response.status_code != 200:
-            if 400 <= response.status_code < 500:
-                # client error, report this to cmyui
-                stacktrace = app.utils.get_appropriate_stacktrace()
-                await app.state.services.log_strange_occurrence(stacktrace)
-            return False
-
-        osu_file_path.write_bytes(response.read())
-
-    return True
+    # need to get the file from the osu!api
+    return await _download_osu_file(osu_file_path, bmap_id) is not None
 
 
 # for some ungodly reason, different values are used to
@@ -366,6 +399,11 @@ class Beatmap:
 
         if not bmap:
             # map not found in cache
+            missing_key = f"bancho:missing_beatmaps:md5:{md5}"
+
+            if await app.state.services.redis.exists(missing_key):
+                # we've recently failed to find this map
+                return None
 
             # to be efficient, we want to cache the whole set
             # at once rather than caching the individual map
@@ -382,6 +420,13 @@ class Beatmap:
                     api_data = await api_get_beatmaps(h=md5)
 
                     if api_data["data"] is None:
+                        if api_data["status_code"] == 200:
+                            # the api has no such map; remember that for a while
+                            await app.state.services.redis.set(
+                                missing_key,
+                                1,
+                                ex=MISSING_BEATMAP_CACHE_TTL,
+                            )
                         return None
 
                     api_response = api_data["data"]
@@ -411,6 +456,11 @@ class Beatmap:
 
         if not bmap:
             # map not found in cache
+            missing_key = f"bancho:missing_beatmaps:id:{bid}"
+
+            if await app.state.services.redis.exists(missing_key):
+                # we've recently failed to find this map
+                return None
 
             # to be efficient, we want to cache the whole set
             # at once rather than caching the individual map
@@ -425,6 +475,13 @@ class Beatmap:
                 api_data = await api_get_beatmaps(b=bid)
 
                 if api_data["data"] is None:
+                    if api_data["status_code"] == 200:
+                        # the api has no such map; remember that for a while
+                        await app.state.services.redis.set(
+                            missing_key,
+                            1,
+                            ex=MISSING_BEATMAP_CACHE_TTL,
+                        )
                     return None
 
                 api_response = api_data["data"]
@@ -515,12 +572,20 @@ class Beatmap:
     @staticmethod
     async def _from_md5_cache(md5: str) -> Beatmap | None:
         """Fetch a map from the cache by md5."""
-        return app.state.cache.beatmap.get(md5, None)
+        bmap = app.state.cache.beatmap.get(md5, None)
+        if bmap is not None:
+            # mark its set as recently used
+            app.state.cache.beatmapset.get(bmap.set_id)
+        return bmap
 
     @staticmethod
     async def _from_bid_cache(bid: int) -> Beatmap | None:
         """Fetch a map from the cache by id."""
-        return app.state.cache.beatmap.get(bid, None)
+        bmap = app.state.cache.beatmap.get(bid, None)
+        if bmap is not None:
+            # mark its set as recently used
+            app.state.cache.beatmapset.get(bmap.set_id)
+        return bmap
 
     async def fetch_rating(self) -> float | None:
         """Fetch the beatmap's rating from sql."""
@@ -967,6 +1032,11 @@ def cache_beatmap(beatmap: Beatmap) -> None:
 
 def cache_beatmap_set(beatmap_set: BeatmapSet) -> None:
     """Add the beatmap set, and each beatmap to the cache."""
+    previous_set = app.state.cache.beatmapset.get(beatmap_set.id)
+    if previous_set is not None and previous_set is not beatmap_set:
+        # don't leave behind any maps the new copy no longer has
+        app.state.cache.uncache_beatmapset_maps(previous_set.id, previous_set)
+
     app.state.cache.beatmapset[beatmap_set.id] = beatmap_set
 
     for beatmap in beatmap_set.maps:
@@ -51,6 +51,9 @@ class Clan:
         player.clan = self
         player.clan_priv = ClanPrivileges.Member
 
+        # drop the api's cached copy of our members
+        await app.state.services.redis.delete(f"bancho:clans:{self.id}")
+
     async def remove_member(self, player: Player) -> None:
         """Remove a given player from the clan's members."""
         self.member_ids.remove(player.id)
@@ -73,5 +76,8 @@ class Clan:
         player.clan = None
         player.clan_priv = None
 
+        # drop the api's cached copy of our members
+        await app.state.services.redis.delete(f"bancho:clans:{self.id}")
+
     def __repr__(self) -> str:
         return f"[{self.tag}] {self.name}"
@@ -435,6 +435,9 @@ class Player:
         if "bancho_priv" in self.__dict__:
             del self.bancho_priv  # wipe cached_property
 
+        # drop the api's cached copy of our row
+        await app.state.services.redis.delete(f"bancho:players:{self.id}")
+
     async def add_privs(self, bits: Privileges) -> None:
         """Update `self`'s privileges, adding `bits`."""
         self.priv |= bits
@@ -447,6 +450,9 @@ class Player:
         if "bancho_priv" in self.__dict__:
             del self.bancho_priv  # wipe cached_property
 
+        # drop the api's cached copy of our row
+        await app.state.services.redis.delete(f"bancho:players:{self.id}")
+
         if self.is_online:
             # if they're online, send a packet
             # to update their client-side privileges
@@ -464,6 +470,9 @@ class Player:
         if "bancho_priv" in self.__dict__:
             del self.bancho_priv  # wipe cached_property
 
+        # drop the api's cached copy of our row
+        await app.state.services.redis.delete(f"bancho:players:{self.id}")
+
         if self.is_online:
             # if they're online, send a packet
             # to update their client-side privileges
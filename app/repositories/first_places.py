@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from typing import Any
+
+import app.state.services
+
+# create table first_places
+# (
+# 	map_md5 char(32) not null,
+# 	mode tinyint not null,
+# 	score_id bigint unsigned not null,
+# 	userid int not null,
+# 	primary key (map_md5, mode)
+# );
+# create index first_places_userid_mode_index
+# 	on first_places (userid, mode);
+
+
+async def upsert(map_md5: str, mode: int, score_id: int, user_id: int) -> None:
+    """Set the #1 score on a beatmap & mode."""
+    query = """\
+        INSERT INTO first_places (map_md5, mode, score_id, userid)
+             VALUES (:map_md5, :mode, :score_id, :user_id)
+        ON DUPLICATE KEY UPDATE score_id = VALUES(score_id),
+                                userid = VALUES(userid)
+    """
+    params: dict[str, Any] = {
+        "map_md5": map_md5,
+        "mode": mode,
+        "score_id": score_id,
+        "user_id": user_id,
+    }
+    await app.state.services.database.execute(query, params)
+
+
+async def refresh_all() -> None:
+    """Recompute every #1 score from the scores table.
+
+    Submissions keep the table up to date as new #1s are set; this
+    catches anything they can't see, such as restrictions & deletions."""
+    # vanilla leaderboards are sorted by score, relax & autopilot by pp
+    query = """\
+        INSERT INTO first_places (map_md5, mode, score_id, userid)
+        SELECT map_md5, mode, id, userid
+          FROM (
+            SELECT s.map_md5, s.mode, s.id, s.userid,
+                   ROW_NUMBER() OVER (
+                     PARTITION BY s.map_md5, s.mode
+                     ORDER BY IF(s.mode < 4, s.score, s.pp) DESC, s.id ASC
+                   ) AS placement
+              FROM scores s
+        INNER JOIN users u ON u.id = s.userid
+             WHERE s.status = 2 AND u.priv & 1
+          ) ranked_scores
+         WHERE placement = 1
+    """
+    async with app.state.services.database.transaction():
+        await app.state.services.database.execute("DELETE FROM first_places")
+        await app.state.services.database.execute(query)
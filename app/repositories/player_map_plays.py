@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from typing import Any
+
+import app.state.services
+
+# create table player_map_plays
+# (
+# 	userid int not null,
+# 	mode tinyint not null,
+# 	map_md5 char(32) not null,
+# 	plays int default 0 not null,
+# 	primary key (userid, mode, map_md5)
+# );
+# create index player_map_plays_userid_mode_plays_index
+# 	on player_map_plays (userid, mode, plays desc);
+
+
+async def increment(user_id: int, mode: int, map_md5: str) -> None:
+    """Count a play of a beatmap by a player in a given mode."""
+    query = """\
+        INSERT INTO player_map_plays (userid, mode, map_md5, plays)
+             VALUES (:user_id, :mode, :map_md5, 1)
+        ON DUPLICATE KEY UPDATE plays = plays + 1
+    """
+    params: dict[str, Any] = {
+        "user_id": user_id,
+        "mode": mode,
+        "map_md5": map_md5,
+    }
+    await app.state.services.database.execute(query, params)
@@ -1,13 +1,67 @@
 from __future__ import annotations
 
+from collections import OrderedDict
+from collections.abc import Callable
 from typing import TYPE_CHECKING
+from typing import TypeVar
 
 if TYPE_CHECKING:
     from app.objects.beatmap import Beatmap, BeatmapSet
 
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class LRUCache(OrderedDict[K, V]):
+    """A dict which evicts its least recently used items past `maxsize`."""
+
+    def __init__(
+        self,
+        maxsize: int,
+        on_evict: Callable[[K, V], None] | None = None,
+    ) -> None:
+        super().__init__()
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+
+    def __getitem__(self, key: K) -> V:
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key: K, value: V) -> None:
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            evicted_key, evicted_value = self.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(evicted_key, evicted_value)
+
+    def get(self, key: K, default: V | None = None) -> V | None:  # type: ignore[override]
+        if key in self:
+            return self[key]
+        return default
+
+
+# beatmap popularity is heavily skewed, so a couple thousand sets
+# (and their maps) serve the vast majority of lookups.
+BEATMAPSET_CACHE_SIZE = 2048
+
+
+def uncache_beatmapset_maps(set_id: int, beatmap_set: BeatmapSet) -> None:
+    """Drop an evicted set's maps from the beatmap index."""
+    for bmap in beatmap_set.maps:
+        beatmap.pop(bmap.md5, None)
+        beatmap.pop(bmap.id, None)
+
 
 bcrypt: dict[bytes, bytes] = {}  # {bcrypt: md5, ...}
+# the cache is bounded by set; `beatmap` only indexes the maps of cached sets,
+# so a map is never cached without (or with a different copy to) its set.
+beatmapset: LRUCache[int, BeatmapSet] = LRUCache(
+    maxsize=BEATMAPSET_CACHE_SIZE,
+    on_evict=uncache_beatmapset_maps,
+)  # {bsid: map_set}
 beatmap: dict[str | int, Beatmap] = {}  # {md5: map, id: map, ...}
-beatmapset: dict[int, BeatmapSet] = {}  # {bsid: map_set}
 unsubmitted: set[str] = set()  # {md5, ...}
 needs_update: set[str] = set()  # {md5, ...}
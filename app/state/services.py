@@ -5,6 +5,7 @@ import pickle
 import re
 import secrets
 from collections.abc import AsyncGenerator
+from collections.abc import Iterable
 from collections.abc import Mapping
 from collections.abc import MutableMapping
 from pathlib import Path
@@ -38,8 +39,19 @@ SQL_UPDATES_FILE = Path.cwd() / "migrations/migrations.sql"
 
 """ session objects """
 
-http_client = httpx.AsyncClient()
-database = databases.Database(f"{app.settings.DB_DSN}?max_size=20")
+# webhooks & osu!api requests come in bursts; keep connections
+# alive between them so we don't redo the tls handshake each time.
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60),
+)
+# keep a few connections warm for bursts of concurrent queries,
+# and recycle idle ones before mysql's wait_timeout drops them.
+database = databases.Database(
+    app.settings.DB_DSN,
+    min_size=5,
+    max_size=20,
+    pool_recycle=600,
+)
 redis: aioredis.Redis = aioredis.from_url(app.settings.REDIS_DSN)
 
 datadog: datadog_client.ThreadStats | None = None
@@ -119,6 +131,45 @@ class IPResolver:
             else:
                 ip_str = headers["X-Real-IP"]
 
+        return self._parse_ip(ip_str)
+
+    def get_ip_from_scope(
+        self,
+        raw_headers: Iterable[tuple[bytes, bytes]],
+    ) -> IPAddress:
+        """Resolve the IP address from an asgi scope's raw headers."""
+        cf_connecting_ip = None
+        forwarded_for = None
+        real_ip = None
+
+        for key, value in raw_headers:
+            if key == b"cf-connecting-ip":
+                cf_connecting_ip = value
+                break
+            elif key == b"x-forwarded-for" and forwarded_for is None:
+                forwarded_for = value
+            elif key == b"x-real-ip" and real_ip is None:
+                real_ip = value
+
+        if cf_connecting_ip is not None:
+            ip_str = cf_connecting_ip.decode("latin-1")
+        else:
+            if forwarded_for is None:
+                raise KeyError("x-forwarded-for")
+
+            forwards = forwarded_for.decode("latin-1").split(",")
+
+            if len(forwards) != 1:
+                ip_str = forwards[0]
+            else:
+                if real_ip is None:
+                    raise KeyError("x-real-ip")
+
+                ip_str = real_ip.decode("latin-1")
+
+        return self._parse_ip(ip_str)
+
+    def _parse_ip(self, ip_str: str) -> IPAddress:
         ip = self.cache.get(ip_str)
         if ip is None:
             ip = ipaddress.ip_address(ip_str)
@@ -0,0 +1,45 @@
+"""Announcements of changes to beatmap sets' ranked statuses."""
+from __future__ import annotations
+
+import datetime
+
+from app.discord import Embed
+
+# discord embed scaffolding for beatmap status announcements
+BEATMAPSET_URL = "https://osu.ppy.sh/beatmapsets/{set_id}"
+BEATMAPSET_COVER_URL = "https://assets.ppy.sh/beatmaps/{set_id}/covers/card.jpg"
+STATUS_EMBED_AUTHOR = "Automatic Status Bot (Click to get beatmap!)"
+STATUS_EMBED_AUTHOR_ICON_URL = "https://a.ppy.sh/1"
+STATUS_EMBED_FOOTER = "Nomination Tools"
+
+STATUS_CHANGE_DESCRIPTION = (
+    "[{artist} - {title} ({creator})](" + BEATMAPSET_URL + ") is now {status}!"
+)
+STATUS_CHANGE_COLOURS = {
+    "loved": 0xFF69B4,  # pink
+    "ranked": 0x0000FF,  # blue
+    "canceled": 0xFF0000,  # red
+}
+
+
+def make_status_embed(
+    description: str,
+    set_id: int,
+    colour: int,
+    timestamp: datetime.datetime,
+) -> Embed:
+    """Create an embed announcing a change to a beatmap set's status."""
+    embed = Embed(
+        title="",
+        description=description,
+        timestamp=timestamp,
+        color=colour,
+    )
+    embed.set_author(
+        name=STATUS_EMBED_AUTHOR,
+        icon_url=STATUS_EMBED_AUTHOR_ICON_URL,
+        url=BEATMAPSET_URL.format(set_id=set_id),
+    )
+    embed.set_image(url=BEATMAPSET_COVER_URL.format(set_id=set_id))
+    embed.set_footer(text=STATUS_EMBED_FOOTER)
+    return embed
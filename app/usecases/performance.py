@@ -7,6 +7,7 @@ from typing import TypedDict
 
 from akatsuki_pp_py import Beatmap
 from akatsuki_pp_py import Calculator
+from akatsuki_pp_py import DifficultyAttributes
 
 from app.constants.mods import Mods
 
@@ -59,8 +60,17 @@ class PerformanceResult(TypedDict):
 def calculate_performances(
     osu_file_path: str,
     scores: Iterable[ScoreParams],
+    osu_file_contents: bytes | None = None,
 ) -> list[PerformanceResult]:
-    calc_bmap = Beatmap(path=osu_file_path)
+    if osu_file_contents is not None:
+        # the caller already read the file; don't have it read again
+        calc_bmap = Beatmap(bytes=osu_file_contents)
+    else:
+        calc_bmap = Beatmap(path=osu_file_path)
+
+    # difficulty attributes only depend on the map, mode & mods, so
+    # they're calculated once & shared between scores (e.g. an acc list)
+    difficulty_attrs: dict[tuple[int, int], DifficultyAttributes] = {}
 
     results: list[PerformanceResult] = []
 
@@ -85,7 +95,13 @@ def calculate_performances(
             n_katu=score.nkatu,
             n_misses=score.nmiss,
         )
+
+        difficulty_key = (score.mode, score.mods or 0)
+        if difficulty_key in difficulty_attrs:
+            calculator.set_difficulty(difficulty_attrs[difficulty_key])
+
         result = calculator.performance(calc_bmap)
+        difficulty_attrs[difficulty_key] = result.difficulty
 
         pp = result.pp
 
@@ -17,8 +17,6 @@ import logging
 import sys
 from collections.abc import Sequence
 import uvicorn
-from starlette.middleware.cors import CORSMiddleware
-from starlette.applications import Starlette
 
 import app.utils
 import app.settings
@@ -91,19 +89,9 @@ def main(argv: Sequence[str]) -> int:
             % app.settings.APP_HOST,
         ) from None
 
-    # Create the ASGI app
-    asgi_app = Starlette()
-
-    # Apply CORS middleware to allow all origins
-    asgi_app.add_middleware(
-        CORSMiddleware,
-        allow_origins=["*"],
-        allow_credentials=True,
-        allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        allow_headers=["*"],
-    )
-
     # Run the server
+    # NOTE: uvicorn's default loop already prefers uvloop when it's installed,
+    # and we always run a single worker - sessions are held in memory.
     uvicorn.run(
         "app.api.init_api:asgi_app",  # Pass the ASGI app as an import string
         reload=app.settings.DEBUG,
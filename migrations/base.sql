@@ -80,6 +80,18 @@ create table favourites
 	primary key (userid, setid)
 );
 
+create table first_places
+(
+	map_md5 char(32) not null,
+	mode tinyint not null,
+	score_id bigint unsigned not null,
+	userid int not null,
+	primary key (map_md5, mode)
+);
+
+create index first_places_userid_mode_index
+	on first_places (userid, mode);
+
 create table ingame_logins
 (
 	id int auto_increment
@@ -91,6 +103,18 @@ create table ingame_logins
 	datetime datetime not null
 );
 
+create table player_map_plays
+(
+	userid int not null,
+	mode tinyint not null,
+	map_md5 char(32) not null,
+	plays int default 0 not null,
+	primary key (userid, mode, map_md5)
+);
+
+create index player_map_plays_userid_mode_plays_index
+	on player_map_plays (userid, mode, plays desc);
+
 create table relationships
 (
 	user1 int not null,
@@ -153,6 +177,9 @@ create table maps
 		unique (md5)
 );
 
+create index maps_set_id_index
+	on maps (set_id, status);
+
 create table mapsets
 (
 	server enum('osu!', 'private') default 'osu!' not null,
@@ -261,6 +288,12 @@ create table stats
 	primary key (id, mode)
 );
 
+create index stats_mode_pp_index
+	on stats (mode, pp desc);
+
+create index stats_mode_rscore_index
+	on stats (mode, rscore desc);
+
 create table tourney_pool_maps
 (
 	map_id int not null,
@@ -315,6 +348,7 @@ create table users
 	userpage_content varchar(2048) charset utf8 null,
 	api_key char(36) null,
 	votes int default 0 not null,
+	discord_id bigint null,
 	constraint users_api_key_uindex
 		unique (api_key),
 	constraint users_email_uindex
@@ -325,6 +359,9 @@ create table users
 		unique (safe_name)
 );
 
+create index users_discord_id_index
+	on users (discord_id);
+
 insert into users (id, name, safe_name, priv, country, silence_end, email, pw_bcrypt, creation_time, latest_activity)
 values (1, 'BanchoBot', 'banchobot', 1, 'ca', 0, 'bot@akatsuki.pw',
         '_______________________my_cool_bcrypt_______________________', UNIX_TIMESTAMP(), UNIX_TIMESTAMP());
@@ -409,3 +409,47 @@ alter table maps drop primary key;
 alter table maps add primary key (id);
 alter table maps modify column server enum('osu!', 'private') not null default 'osu!' after id;
 unlock tables;
+
+# v4.8.2
+create index maps_set_id_index on maps (set_id, status);
+
+# v4.8.3
+alter table users add discord_id bigint null after votes;
+create index users_discord_id_index on users (discord_id);
+
+# v4.8.4
+create table first_places
+(
+	map_md5 char(32) not null,
+	mode tinyint not null,
+	score_id bigint unsigned not null,
+	userid int not null,
+	primary key (map_md5, mode)
+);
+create index first_places_userid_mode_index on first_places (userid, mode);
+insert into first_places (map_md5, mode, score_id, userid)
+select map_md5, mode, id, userid from (
+	select s.map_md5, s.mode, s.id, s.userid, row_number() over (
+		partition by s.map_md5, s.mode
+		order by if(s.mode < 4, s.score, s.pp) desc, s.id asc
+	) as placement
+	from scores s inner join users u on u.id = s.userid
+	where s.status = 2 and u.priv & 1
+) ranked_scores where placement = 1;
+
+# v4.8.5
+create table player_map_plays
+(
+	userid int not null,
+	mode tinyint not null,
+	map_md5 char(32) not null,
+	plays int default 0 not null,
+	primary key (userid, mode, map_md5)
+);
+create index player_map_plays_userid_mode_plays_index on player_map_plays (userid, mode, plays desc);
+insert into player_map_plays (userid, mode, map_md5, plays)
+select userid, mode, map_md5, count(*) from scores group by userid, mode, map_md5;
+
+# v4.8.6
+create index stats_mode_pp_index on stats (mode, pp desc);
+create index stats_mode_rscore_index on stats (mode, rscore desc);
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+
+import pytest
+
+from app.bg_loops import QUALIFIED_MAPS_RESYNC_INTERVAL
+from app.bg_loops import _next_deadline
+from app.bg_loops import _qualified_sets_wait_timeout
+from app.bg_loops import _run_periodically
+
+
+@pytest.mark.parametrize(
+    ("deadline", "interval", "now", "expected"),
+    [
+        # the task finished before its next deadline
+        (100.0, 60.0, 130.0, 160.0),
+        # time spent in the task doesn't push the schedule back
+        (100.0, 60.0, 159.0, 160.0),
+        # an overrun skips the missed runs, staying on the schedule
+        (100.0, 60.0, 160.0, 220.0),
+        (100.0, 60.0, 290.0, 340.0),
+    ],
+)
+def test_next_deadline(
+    deadline: float,
+    interval: float,
+    now: float,
+    expected: float,
+) -> None:
+    assert _next_deadline(deadline, interval, now) == expected
+
+
+@pytest.mark.parametrize(
+    ("seconds_until_due", "expected"),
+    [
+        # nothing is qualified
+        (None, QUALIFIED_MAPS_RESYNC_INTERVAL),
+        # sleep until just past the next set's due time
+        (30, 31),
+        # a set is already due
+        (0, 1),
+        (-5, 1),
+        # a set far in the future still waits at most a resync interval
+        (QUALIFIED_MAPS_RESYNC_INTERVAL * 24, QUALIFIED_MAPS_RESYNC_INTERVAL),
+    ],
+)
+def test_qualified_sets_wait_timeout(
+    seconds_until_due: int | None,
+    expected: float,
+) -> None:
+    assert _qualified_sets_wait_timeout(seconds_until_due) == expected
+
+
+async def test_run_periodically_survives_task_exceptions() -> None:
+    runs = 0
+
+    async def flaky_task() -> None:
+        nonlocal runs
+        runs += 1
+        if runs < 3:
+            raise RuntimeError("task failed")
+
+    loop = asyncio.get_running_loop()
+    reported: list[dict[str, Any]] = []
+    loop.set_exception_handler(lambda _loop, context: reported.append(context))
+
+    task = loop.create_task(
+        _run_periodically(flaky_task, interval=0.01, run_immediately=True),
+    )
+    try:
+        while runs < 3:
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+        loop.set_exception_handler(None)
+
+    assert [type(context["exception"]) for context in reported] == [
+        RuntimeError,
+        RuntimeError,
+    ]
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+import pytest
+
+import app.state.cache
+from app.objects.beatmap import Beatmap
+from app.objects.beatmap import BeatmapSet
+from app.objects.beatmap import RankedStatus
+from app.objects.beatmap import cache_beatmap_set
+from app.state.cache import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used() -> None:
+    cache: LRUCache[str, int] = LRUCache(maxsize=2)
+    cache["a"] = 1
+    cache["b"] = 2
+
+    # reading "a" makes "b" the least recently used
+    assert cache["a"] == 1
+    cache["c"] = 3
+
+    assert "b" not in cache
+    assert list(cache) == ["a", "c"]
+
+
+def test_lru_cache_get_refreshes_recency() -> None:
+    cache: LRUCache[str, int] = LRUCache(maxsize=2)
+    cache["a"] = 1
+    cache["b"] = 2
+
+    assert cache.get("a") == 1
+    assert cache.get("missing") is None
+    cache["c"] = 3
+
+    assert list(cache) == ["a", "c"]
+
+
+def test_lru_cache_calls_on_evict() -> None:
+    evicted: list[tuple[str, int]] = []
+    cache: LRUCache[str, int] = LRUCache(
+        maxsize=1,
+        on_evict=lambda key, value: evicted.append((key, value)),
+    )
+    cache["a"] = 1
+    cache["b"] = 2
+
+    assert evicted == [("a", 1)]
+
+
+@pytest.fixture
+def beatmap_caches(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(
+        app.state.cache,
+        "beatmapset",
+        LRUCache(maxsize=1, on_evict=app.state.cache.uncache_beatmapset_maps),
+    )
+    monkeypatch.setattr(app.state.cache, "beatmap", {})
+
+
+def _make_set(set_id: int, md5: str, status: RankedStatus) -> BeatmapSet:
+    bmap_set = BeatmapSet(id=set_id, last_osuapi_check=datetime.now())
+    bmap_set.maps.append(
+        Beatmap(bmap_set, md5=md5, id=set_id * 10, set_id=set_id, status=status),
+    )
+    return bmap_set
+
+
+@pytest.mark.usefixtures("beatmap_caches")
+async def test_evicted_set_takes_its_maps_with_it() -> None:
+    cache_beatmap_set(_make_set(1, "a" * 32, RankedStatus.Pending))
+    cache_beatmap_set(_make_set(2, "b" * 32, RankedStatus.Pending))
+
+    assert 1 not in app.state.cache.beatmapset
+    assert await Beatmap._from_md5_cache("a" * 32) is None
+    assert await Beatmap._from_bid_cache(10) is None
+
+
+@pytest.mark.usefixtures("beatmap_caches")
+async def test_recached_set_does_not_serve_a_stale_status() -> None:
+    cache_beatmap_set(_make_set(1, "a" * 32, RankedStatus.Qualified))
+    cache_beatmap_set(_make_set(2, "b" * 32, RankedStatus.Pending))
+
+    # the set was ranked while evicted, and is loaded again from the db
+    cache_beatmap_set(_make_set(1, "a" * 32, RankedStatus.Ranked))
+
+    bmap = await Beatmap._from_md5_cache("a" * 32)
+    assert bmap is not None
+    assert bmap.status == RankedStatus.Ranked
+    assert bmap.set is app.state.cache.beatmapset[1]
+
+
+@pytest.mark.usefixtures("beatmap_caches")
+async def test_map_lookups_keep_their_set_cached() -> None:
+    app.state.cache.beatmapset.maxsize = 2
+    cache_beatmap_set(_make_set(1, "a" * 32, RankedStatus.Ranked))
+    cache_beatmap_set(_make_set(2, "b" * 32, RankedStatus.Ranked))
+
+    # looking up set 1's map makes set 2 the least recently used
+    assert await Beatmap._from_md5_cache("a" * 32) is not None
+    cache_beatmap_set(_make_set(3, "c" * 32, RankedStatus.Ranked))
+
+    assert list(app.state.cache.beatmapset) == [1, 3]
+    assert "b" * 32 not in app.state.cache.beatmap
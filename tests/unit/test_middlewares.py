@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+from collections.abc import AsyncIterator
+
+import pytest
+from starlette.requests import ClientDisconnect
+from starlette.types import ASGIApp
+from starlette.types import Message
+from starlette.types import Receive
+from starlette.types import Scope
+from starlette.types import Send
+
+import app.api.middlewares
+import app.state
+from app.api.middlewares import ClientDisconnectMiddleware
+from app.api.middlewares import MetricsMiddleware
+from app.api.middlewares import RateLimitMiddleware
+
+
+async def _ok_app(scope: Scope, receive: Receive, send: Send) -> None:
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _make_scope(host: str, ip: str) -> Scope:
+    return {
+        "type": "http",
+        "method": "GET",
+        "path": "/v1/get_player_count",
+        "headers": [
+            (b"host", host.encode()),
+            (b"cf-connecting-ip", ip.encode()),
+        ],
+    }
+
+
+async def _receive() -> Message:
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def _request(asgi_app: ASGIApp, scope: Scope) -> list[Message]:
+    messages: list[Message] = []
+
+    async def send(message: Message) -> None:
+        messages.append(message)
+
+    await asgi_app(scope, _receive, send)
+    return messages
+
+
+@pytest.fixture(autouse=True)
+def ip_resolver(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(
+        app.state.services,
+        "ip_resolver",
+        app.state.services.IPResolver(),
+        raising=False,
+    )
+
+
+@pytest.fixture(autouse=True)
+async def request_log_flusher() -> AsyncIterator[None]:
+    yield
+    flush_task = app.api.middlewares.request_log_flush_task
+    if flush_task is not None:
+        flush_task.cancel()
+        app.state.sessions.housekeeping_tasks.discard(flush_task)
+        app.api.middlewares.request_log_flush_task = None
+
+
+@pytest.fixture
+async def rate_limiter() -> AsyncIterator[RateLimitMiddleware]:
+    middleware = RateLimitMiddleware(_ok_app, max_requests_per_second=2)
+    yield middleware
+    if middleware.sweeper_task is not None:
+        middleware.sweeper_task.cancel()
+        app.state.sessions.housekeeping_tasks.discard(middleware.sweeper_task)
+
+
+async def test_rate_limit_per_ip(rate_limiter: RateLimitMiddleware) -> None:
+    scope = _make_scope("api.example.com", "1.1.1.1")
+    statuses = [(await _request(rate_limiter, scope))[0]["status"] for _ in range(3)]
+    assert statuses == [200, 200, 429]
+
+    # other clients have their own buckets
+    other_scope = _make_scope("api.example.com", "2.2.2.2")
+    assert (await _request(rate_limiter, other_scope))[0]["status"] == 200
+
+
+async def test_rate_limit_rejections_are_not_shared(
+    rate_limiter: RateLimitMiddleware,
+) -> None:
+    # an outer middleware modifying our 429 mustn't affect later ones
+    async def append_header(message: Message) -> None:
+        if message["type"] == "http.response.start":
+            message["headers"].append((b"x-outer", b"1"))
+
+    scope = _make_scope("api.example.com", "1.1.1.1")
+    for _ in range(2 + 2):
+        await rate_limiter(scope, _receive, append_header)
+
+    messages = await _request(rate_limiter, scope)
+    assert messages[0]["status"] == 429
+    assert (b"x-outer", b"1") not in messages[0]["headers"]
+
+
+async def test_rate_limit_rejections_are_sampled(
+    rate_limiter: RateLimitMiddleware,
+) -> None:
+    app.api.middlewares.request_log_buffer.clear()
+
+    scope = _make_scope("api.example.com", "1.1.1.1")
+    for _ in range(2 + 10):
+        await _request(rate_limiter, scope)
+
+    rejection_logs = [
+        line
+        for line in app.api.middlewares.request_log_buffer
+        if b"Rate Limit Exceeded" in line
+    ]
+    assert len(rejection_logs) == 1
+
+
+async def test_rate_limit_skips_non_api_hosts(
+    rate_limiter: RateLimitMiddleware,
+) -> None:
+    scope = _make_scope("osu.example.com", "1.1.1.1")
+    for _ in range(5):
+        assert (await _request(rate_limiter, scope))[0]["status"] == 200
+
+
+async def test_metrics_sets_process_time_header() -> None:
+    middleware = MetricsMiddleware(_ok_app)
+    messages = await _request(middleware, _make_scope("osu.example.com", "1.1.1.1"))
+
+    assert messages[0]["status"] == 200
+    assert any(key == b"process-time" for key, _ in messages[0]["headers"])
+
+
+async def test_client_disconnects_are_dropped() -> None:
+    async def disconnected_app(scope: Scope, receive: Receive, send: Send) -> None:
+        raise ClientDisconnect()
+
+    middleware = ClientDisconnectMiddleware(disconnected_app)
+    scope = _make_scope("osu.example.com", "1.1.1.1")
+    assert await _request(middleware, scope) == []